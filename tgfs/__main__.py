@@ -45,7 +45,8 @@ async def additional_check():
         minor = int(_version[1])
         # patch = int(_version[2])
         if minor != Version.minor or major != Version.major:
-            # ToDo: Create Migration Script execute based on version
+            # Data migrations run in the background whatever VERSION says; each
+            # keeps its own done marker, see MigrationRunner
             log.warning("version mismatch detected. Old version: %s, Current version: %s", version, __version__)
         await DB.db.set_config_value("VERSION", __version__)
         await DB.db.set_config_value("OLD_VERSION", version)
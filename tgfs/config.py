@@ -32,7 +32,7 @@ parser.add_argument("--host", help="Bind host")
 parser.add_argument("--port", type=int, help="Bind port")
 parser.add_argument("--public-url", help="Public base URL")
 parser.add_argument("--connection-limit", type=int, help="Max concurrent connections")
-parser.add_argument("--db-backend", help="Database server", choices=("mysql", "mongodb"))
+parser.add_argument("--db-backend", help="Database server", choices=("mysql", "mongodb", "sqlite", "memory"))
 parser.add_argument("--no-update", action="store_true", help="Ignore Telegram Updates")
 parser.add_argument("--session", help="Name for current instance", default="tgfilestream")
 args = parser.parse_args()
@@ -55,17 +55,32 @@ class Config(ConfigBase):
         "db": (str, None),
         "minsize": (int, 1),
         "maxsize": (int, 5),
+        "replica_hosts": (str, ""),
+        "replica_user": (str, ""),
+        "replica_password": (str, ""),
+        "replica_window": (int, 5),
+        "partitions": (int, 0),
     }
 
     MONGODB_REQUIRED = {"uri"}
     MONGODB_CONFIG = {
         "uri": (str, None),
-        "dbname": (str, "TGFS")
+        "dbname": (str, "TGFS"),
+        "id_block": (int, 100),
+    }
+
+    SQLITE_REQUIRED: set[str] = set()
+    SQLITE_CONFIG = {
+        "path": (str, "tgfs.db"),
+        "cached_statements": (int, 256),
     }
 
     DB_LIST = {
         "mysql": ("MYSQL", MYSQL_CONFIG, MYSQL_REQUIRED),
-        "mongodb": ("MONGODB", MONGODB_CONFIG, MONGODB_REQUIRED)
+        "mongodb": ("MONGODB", MONGODB_CONFIG, MONGODB_REQUIRED),
+        "sqlite": ("SQLITE", SQLITE_CONFIG, SQLITE_REQUIRED),
+        # Nothing is persisted; for tests and benchmarks only
+        "memory": ("MEMORY", {}, set()),
     }
 
     # ---------- Telegram ----------
@@ -117,6 +132,12 @@ class Config(ConfigBase):
             f"Valid options: {DB_LIST.keys()}"
         )
 
+    WRITE_BEHIND: bool = ConfigBase.env_bool("WRITE_BEHIND")
+    WRITE_BEHIND_BATCH: int = ConfigBase.env_int("WRITE_BEHIND_BATCH", 500)
+    WRITE_BEHIND_DELAY_MS: int = ConfigBase.env_int("WRITE_BEHIND_DELAY_MS", 500)
+    MIGRATION_BATCH_SIZE: int = ConfigBase.env_int("MIGRATION_BATCH_SIZE", 1000)
+    MIGRATION_DELAY_MS: int = ConfigBase.env_int("MIGRATION_DELAY_MS", 100)
+
     SESSION_NAME: str = args.session
 
     # ---------- Extras ----------
@@ -126,6 +147,28 @@ class Config(ConfigBase):
     CACHE_DIR = Path("cache")
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+    # ---------- Cache ----------
+    FILE_CACHE: bool = ConfigBase.env_bool("FILE_CACHE")
+    FILE_CACHE_DIR: Path = Path(environ.get("FILE_CACHE_DIR", CACHE_DIR / "files"))
+    FILE_CACHE_SIZE: int = ConfigBase.env_int("FILE_CACHE_SIZE", 4 * 1024 * 1024 * 1024)
+    FILE_CACHE_MAX_FILE: int = ConfigBase.env_int("FILE_CACHE_MAX_FILE", 512 * 1024 * 1024)
+    METADATA_CACHE_SIZE: int = ConfigBase.env_int("METADATA_CACHE_SIZE", 4096)
+    METADATA_CACHE_TTL: int = ConfigBase.env_int("METADATA_CACHE_TTL", 300)
+    NEGATIVE_CACHE_TTL: int = ConfigBase.env_int("NEGATIVE_CACHE_TTL", 60)
+    USER_CACHE_SIZE: int = ConfigBase.env_int("USER_CACHE_SIZE", 10000)
+    USER_CACHE_TTL: int = ConfigBase.env_int("USER_CACHE_TTL", 600)
+    BAN_REFRESH_INTERVAL: int = ConfigBase.env_int("BAN_REFRESH_INTERVAL", 60)
+    REJECTED_TOKEN_CACHE_SIZE: int = ConfigBase.env_int("REJECTED_TOKEN_CACHE_SIZE", 10000)
+    SHARED_CACHE_URL: str = environ.get("SHARED_CACHE_URL", "")
+    SHARED_CACHE_TTL: int = ConfigBase.env_int("SHARED_CACHE_TTL", 3600)
+    ZIP_CRC_CACHE_SIZE: int = ConfigBase.env_int("ZIP_CRC_CACHE_SIZE", 100000)
+    ZIP_PREFETCH_CHUNKS: int = ConfigBase.env_int("ZIP_PREFETCH_CHUNKS", 4)
+    PREFETCH_NEXT: bool = ConfigBase.env_bool("PREFETCH_NEXT")
+    PREFETCH_PARTS: int = ConfigBase.env_int("PREFETCH_PARTS", 4)
+    PREFETCH_DELAY: int = ConfigBase.env_int("PREFETCH_DELAY", 5)
+    PREFETCH_TTL: int = ConfigBase.env_int("PREFETCH_TTL", 1800)
+    PREFETCH_CACHE_SIZE: int = ConfigBase.env_int("PREFETCH_CACHE_SIZE", 256 * 1024 * 1024)
+
     # ---------- Security ----------
     SECRET: Optional[bytes] = None
     BOT_ID: Optional[int] = None
@@ -18,15 +18,24 @@ from typing import Optional
 from tgfs.config import Config
 from tgfs.database.mysql import MySQLDB
 from tgfs.database.mongodb import MongoDB
+from tgfs.database.sqlite import SQLiteDB
+from tgfs.database.memory import MemoryDB
+from tgfs.database.cache import CacheDB
 from tgfs.database.database import BaseStorage
+from tgfs.database.migration import MigrationRunner
+from tgfs.database.shared_cache import SharedCache, shared_cache_from_url
 
 _BACKENDS: dict[str, type[BaseStorage]] = {
     "mysql": MySQLDB,
     "mongodb": MongoDB,
+    "sqlite": SQLiteDB,
+    "memory": MemoryDB,
 }
 
 class DB:
     db: Optional[BaseStorage] = None
+    shared: Optional[SharedCache] = None
+    migrations: Optional[MigrationRunner] = None
 
     @classmethod
     async def init(cls) -> None:
@@ -37,9 +46,27 @@ class DB:
 
         await cls.db.connect(**Config.DB_CONFIG)
         await cls.db.init_db()
+        cls.migrations = MigrationRunner(cls.db, Config.MIGRATION_BATCH_SIZE, Config.MIGRATION_DELAY_MS / 1000)
+        cls.migrations.start()
+        if isinstance(cls.db, CacheDB):
+            await cls.db.track_banned(Config.BAN_REFRESH_INTERVAL)
+
+        if Config.SHARED_CACHE_URL and cls.shared is None and isinstance(cls.db, CacheDB):
+            cls.shared = shared_cache_from_url(Config.SHARED_CACHE_URL, Config.SHARED_CACHE_TTL)
+            await cls.shared.connect()
+            cls.db.use_shared_cache(cls.shared)
 
     @classmethod
     async def close(cls):
+        if cls.migrations:
+            await cls.migrations.stop()
+            cls.migrations = None
         if cls.db:
+            await cls.db.flush()
+            if isinstance(cls.db, CacheDB):
+                cls.db.stop_tracking_banned()
             await cls.db.close()
             cls.db = None
+        if cls.shared:
+            await cls.shared.close()
+            cls.shared = None
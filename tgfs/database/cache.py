@@ -0,0 +1,284 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+from dataclasses import asdict, replace
+from typing import Any, Optional
+
+from telethon.tl.types import InputDocumentFileLocation, InputPhotoFileLocation
+
+from tgfs.config import Config
+from tgfs.database.database import BaseStorage
+from tgfs.database.shared_cache import SharedCache
+from tgfs.utils.cache_util import AsyncLRUCache
+from tgfs.utils.types import FileInfo, FileSource, InputTypeLocation, User
+
+log = logging.getLogger(__name__)
+
+def _user_to_dict(user: User) -> dict[str, Any]:
+    return {
+        "user_id": user.user_id,
+        "join_date": user.join_date.isoformat() if user.join_date else None,
+        "ban_date": user.ban_date.isoformat() if user.ban_date else None,
+        "warns": user.warns,
+        "preferred_lang": user.preferred_lang,
+        "curt_op": user.curt_op.value,
+        "op_id": user.op_id,
+    }
+
+
+class CacheDB(BaseStorage):
+    """
+    Caches the metadata looked up on every HTTP request.
+
+    Must come before the backend mixins in the MRO so that ``super()``
+    resolves to the actual database implementation. When a shared cache is
+    attached, local misses are looked up there before hitting the database.
+    """
+
+    _shared: Optional[SharedCache] = None
+    _ban_refresh: Optional[asyncio.Task] = None
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._file_cache = AsyncLRUCache(
+            self._load_file, Config.METADATA_CACHE_SIZE, False,
+            ttl=Config.METADATA_CACHE_TTL,
+            key=lambda file_id, user_id=None: (file_id, user_id),
+            negative_ttl=Config.NEGATIVE_CACHE_TTL,
+            tags=lambda k: (("file", k[0]), ("user", k[1]))
+        )
+        self._location_cache = AsyncLRUCache(
+            self._load_location, Config.METADATA_CACHE_SIZE, False,
+            ttl=Config.METADATA_CACHE_TTL,
+            key=lambda file, bot_id: (file.id, bot_id),
+            tags=lambda k: (k[0],)
+        )
+        self._banned: set[int] = set()
+        self._user_cache = AsyncLRUCache(
+            self._load_user, Config.USER_CACHE_SIZE, True,
+            ttl=Config.USER_CACHE_TTL,
+            negative_ttl=Config.NEGATIVE_CACHE_TTL
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **super().stats(),
+            "cache": {
+                "file": self._file_cache.stats.to_dict(),
+                "location": self._location_cache.stats.to_dict(),
+                "user": self._user_cache.stats.to_dict(),
+            }
+        }
+
+    async def track_banned(self, interval: int) -> None:
+        """
+        Load the banned users and reload them every ``interval`` seconds, to
+        pick up bans made by other instances.
+        """
+        self._banned = await super().get_banned_users()
+        if interval > 0 and self._ban_refresh is None:
+            self._ban_refresh = asyncio.create_task(self._refresh_banned(interval))
+
+    async def _refresh_banned(self, interval: int) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._banned = await super().get_banned_users()
+            except Exception: # pylint: disable=W0718
+                log.warning("Failed to reload banned users", exc_info=True)
+
+    def stop_tracking_banned(self) -> None:
+        if self._ban_refresh is not None:
+            self._ban_refresh.cancel()
+            self._ban_refresh = None
+
+    def known_banned(self, user_id: int) -> bool:
+        return user_id in self._banned
+
+    def use_shared_cache(self, shared: SharedCache) -> None:
+        self._shared = shared
+        shared.subscribe(self._drop)
+
+    def _drop(self, ns: str, obj_id: int) -> None:
+        if ns == "file":
+            self._file_cache.invalidate_tag(("file", obj_id))
+        elif ns == "user_files":
+            self._file_cache.invalidate_tag(("user", obj_id))
+        elif ns == "loc":
+            self._location_cache.invalidate_tag(obj_id)
+        elif ns == "user":
+            # May have been unbanned elsewhere; the next lookup decides
+            self._banned.discard(obj_id)
+            self._user_cache.invalidate(obj_id)
+
+    async def _invalidate(self, ns: str, obj_id: int) -> None:
+        self._drop(ns, obj_id)
+        if self._shared is not None:
+            await self._shared.invalidate(ns, obj_id)
+
+    async def _invalidate_many(self, ns: str, obj_ids: set[int]) -> None:
+        for obj_id in obj_ids:
+            self._drop(ns, obj_id)
+        if self._shared is not None:
+            await asyncio.gather(*(self._shared.invalidate(ns, obj_id) for obj_id in obj_ids))
+
+    async def _load_file(self, file_id: int, user_id: Optional[int] = None) -> Optional[FileInfo]:
+        if self._shared is None:
+            return await super().get_file(file_id, user_id)
+        key = f"{file_id}:{user_id}"
+        if user_id is None:
+            data, version = await self._shared.get("file", file_id, key)
+        else:
+            data, version = await self._shared.get("file", file_id, key, ("user_files", user_id))
+        if data is not None:
+            return FileInfo(**data)
+        file = await super().get_file(file_id, user_id)
+        if file is not None:
+            await self._shared.set("file", key, asdict(file), version)
+        return file
+
+    async def _load_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
+        if self._shared is None:
+            return await super().get_location(file, bot_id)
+        key = f"{file.id}:{bot_id}"
+        data, version = await self._shared.get("loc", file.id, key)
+        if data is not None:
+            cls = InputPhotoFileLocation if file.thumb_size else InputDocumentFileLocation
+            return cls(
+                id=file.id,
+                access_hash=data["access_hash"],
+                file_reference=bytes.fromhex(data["file_reference"]),
+                thumb_size=file.thumb_size
+            )
+        loc = await super().get_location(file, bot_id)
+        if loc is not None:
+            await self._shared.set("loc", key, {
+                "access_hash": loc.access_hash,
+                "file_reference": loc.file_reference.hex(),
+            }, version)
+        return loc
+
+    async def get_file(self, file_id: int, user_id: Optional[int] = None) -> Optional[FileInfo]:
+        return await self._file_cache(file_id, user_id)
+
+    async def get_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
+        return await self._location_cache(file, bot_id)
+
+    async def resolve_stream(self, file_id: int, user_id: int, bot_id: int
+                             ) -> tuple[Optional[FileInfo], Optional[InputTypeLocation]]:
+        found, file = self._file_cache.peek(file_id, user_id)
+        if found:
+            if file is None or file.is_deleted:
+                return file, None
+            return file, await self.get_location(file, bot_id)
+
+        if self._shared is not None:
+            # Through the loaders, which read and fill the shared cache
+            file = await self.get_file(file_id, user_id)
+            if file is None or file.is_deleted:
+                return file, None
+            return file, await self.get_location(file, bot_id)
+
+        # Keys as built by the cache key functions. Whatever is invalidated
+        # while the query runs is not cached.
+        file_key, loc_key = (file_id, user_id), (file_id, bot_id)
+        file_token = self._file_cache.begin_key(file_key)
+        loc_token = self._location_cache.begin_key(loc_key)
+        try:
+            file, loc = await super().resolve_stream(file_id, user_id, bot_id)
+        finally:
+            file_valid = self._file_cache.end_key(file_key, file_token)
+            loc_valid = self._location_cache.end_key(loc_key, loc_token)
+        if file_valid:
+            self._file_cache.prime(file, file_id, user_id)
+        if loc is not None and loc_valid:
+            self._location_cache.prime(loc, file, bot_id)
+        return file, loc
+
+    async def add_file(self, user_id: int, file: FileInfo, source: FileSource) -> None:
+        await super().add_file(user_id, file, source)
+        await self._invalidate("file", file.id)
+
+    async def update_file_restriction(self, file_id: int, status: bool) -> None:
+        await super().update_file_restriction(file_id, status)
+        await self._invalidate("file", file_id)
+
+    async def upsert_location(self, bot_id: int, loc: InputTypeLocation) -> None:
+        await super().upsert_location(bot_id, loc)
+        await self._invalidate("loc", loc.id)
+
+    async def delete_file(self, file_id: int) -> bool:
+        deleted = await super().delete_file(file_id)
+        await self._invalidate("file", file_id)
+        await self._invalidate("loc", file_id)
+        return deleted
+
+    async def remove_file(self, file_id: int, user_id: int) -> bool:
+        removed = await super().remove_file(file_id, user_id)
+        await self._invalidate("file", file_id)
+        return removed
+
+    async def add_files_to_group(self, group_id: int, user_id: int, bot_id: int,
+                                 files: list[tuple[FileInfo, FileSource, InputTypeLocation]]) -> None:
+        await super().add_files_to_group(group_id, user_id, bot_id, files)
+        file_ids = {file.id for file, _, _ in files}
+        await self._invalidate_many("file", file_ids)
+        await self._invalidate_many("loc", file_ids)
+
+    async def _load_user(self, user_id: int) -> Optional[User]:
+        if self._shared is None:
+            return await super().get_user(user_id)
+        data, version = await self._shared.get("user", user_id, user_id)
+        if data is not None:
+            return User.from_row(data)
+        user = await super().get_user(user_id)
+        if user is not None:
+            await self._shared.set("user", user_id, _user_to_dict(user), version)
+        return user
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        # Callers change the returned user before passing it to upsert_user,
+        # so the cached instance is never handed out.
+        user = await self._user_cache(user_id)
+        if user is None:
+            return None
+        if user.is_banned:
+            self._banned.add(user_id)
+        return replace(user)
+
+    async def add_user(self, user_id: int) -> bool:
+        added = await super().add_user(user_id)
+        await self._invalidate("user", user_id)
+        return added
+
+    async def upsert_user(self, user: User) -> bool:
+        result = await super().upsert_user(user)
+        await self._invalidate("user", user.user_id)
+        self._user_cache.prime(replace(user), user.user_id)
+        if user.is_banned:
+            self._banned.add(user.user_id)
+        else:
+            self._banned.discard(user.user_id)
+        return result
+
+    async def delete_user(self, user_id: int) -> bool:
+        deleted = await super().delete_user(user_id)
+        self._banned.discard(user_id)
+        await self._invalidate("user", user_id)
+        await self._invalidate("user_files", user_id)
+        return deleted
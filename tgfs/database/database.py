@@ -15,9 +15,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from abc import ABC, abstractmethod
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Optional
 
-from tgfs.utils.types import SupportedType, FileInfo, FileSource, GroupInfo, InputTypeLocation, User
+from tgfs.database.migration import Migration
+from tgfs.utils.types import SupportedType, FileInfo, FileSource, GroupFile, GroupInfo, InputTypeLocation, PageCursor, User
 
 
 class BaseStorage(ABC):
@@ -51,6 +52,17 @@ class BaseStorage(ABC):
         """Create tables if they don't exist."""
         raise NotImplementedError
 
+    def stats(self) -> dict[str, Any]:
+        """Runtime counters shown on the status page."""
+        return {}
+
+    async def flush(self) -> None:
+        """Write out anything buffered in memory. Called before :meth:`close`."""
+
+    def migrations(self) -> list[Migration]:
+        """Data migrations this backend runs in the background after :meth:`init_db`."""
+        return []
+
     @abstractmethod
     async def add_file(self, user_id: int, file: FileInfo, source: FileSource) -> None:
         raise NotImplementedError
@@ -67,6 +79,12 @@ class BaseStorage(ABC):
     async def get_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
         raise NotImplementedError
 
+    @abstractmethod
+    async def resolve_stream(self, file_id: int, user_id: int, bot_id: int
+                             ) -> tuple[Optional[FileInfo], Optional[InputTypeLocation]]:
+        """Fetch a user's file and its location for ``bot_id`` in a single lookup."""
+        raise NotImplementedError
+
     @abstractmethod
     async def get_source(self, file_id: int, user_id: int) -> Optional[FileSource]:
         raise NotImplementedError
@@ -76,8 +94,20 @@ class BaseStorage(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    async def get_files(self, user_id: int, offset: int = 0, limit: Optional[int] = None
-                        ) -> AsyncGenerator[tuple[int, str], None]:
+    async def upsert_locations(self, items: list[tuple[int, InputTypeLocation]]) -> None:
+        """Same as :meth:`upsert_location` for ``(bot_id, location)`` pairs, as one batch."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_files(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                        after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+                        ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        """
+        Yield the user's files newest first as ``(file_id, name, cursor)``.
+
+        ``after``/``before`` select the page following/preceding a cursor
+        returned earlier and take precedence over ``offset``.
+        """
         raise NotImplementedError
 
     @abstractmethod
@@ -91,6 +121,7 @@ class BaseStorage(ABC):
 
     @abstractmethod
     async def total_files(self, user_id: int) -> int:
+        """Number of files in the user's library, read from a maintained counter."""
         raise NotImplementedError
 
     @abstractmethod
@@ -110,14 +141,48 @@ class BaseStorage(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    async def get_groups(self, user_id: int, offset: int = 0, limit: Optional[int] = None
-    ) -> AsyncGenerator[tuple[int, str], None]:
+    async def add_files_to_group(self, group_id: int, user_id: int, bot_id: int,
+                                 files: list[tuple[FileInfo, FileSource, InputTypeLocation]]) -> None:
+        """
+        Add files to the user's library and append them to a group, in the
+        given order, as a single batch.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_groups(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                         after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+    ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        """Same as :meth:`get_files` for the user's groups."""
         raise NotImplementedError
 
     @abstractmethod
     async def get_group(self, group_id: int, user_id: int) -> Optional[GroupInfo]:
         raise NotImplementedError
 
+    @abstractmethod
+    async def get_group_with_files(self, group_id: int, user_id: int
+                                   ) -> Optional[tuple[GroupInfo, list[GroupFile]]]:
+        """
+        Return the group and its files in order, read in a single round
+        trip. ``GroupInfo.files`` is filled with the same ids.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def iter_group_files(self, group_id: int, user_id: int, batch_size: int = 500
+                               ) -> AsyncGenerator[GroupFile, None]:
+        """Yield the files of a group in order without loading them all at once."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_next_group_file(self, file_id: int, user_id: int) -> Optional[int]:
+        """
+        Return the file that follows ``file_id`` in the user's most recently
+        created group containing it, if any.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     async def delete_group(self, group_id: int, user_id: int) -> None:
         raise NotImplementedError
@@ -132,6 +197,7 @@ class BaseStorage(ABC):
 
     @abstractmethod
     async def total_groups(self, user_id: int) -> int:
+        """Number of groups owned by the user, read from a maintained counter."""
         raise NotImplementedError
 
     @abstractmethod
@@ -158,6 +224,26 @@ class BaseStorage(ABC):
     async def count_users(self) -> int:
         raise NotImplementedError
 
+    @abstractmethod
+    async def get_banned_users(self) -> set[int]:
+        raise NotImplementedError
+
+    def known_banned(self, user_id: int) -> bool:
+        """
+        Whether the user is known to be banned without a database lookup.
+        ``False`` means unknown, not allowed.
+        """
+        return False
+
+    @abstractmethod
+    async def recount(self, user_id: Optional[int] = None) -> None:
+        """
+        Rebuild the counters behind :meth:`total_files` and
+        :meth:`total_groups` for one user, or for every user when
+        ``user_id`` is ``None``.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     async def get_secret(self, rotate=False) -> bytes:
         raise NotImplementedError
@@ -0,0 +1,372 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import datetime
+import itertools
+import os
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field, replace
+from typing import AsyncGenerator, Optional
+
+from tgfs.database.database import BaseStorage
+from tgfs.utils.types import (
+    FileInfo, FileSource, GroupFile, GroupInfo, InputTypeLocation, PageCursor, SupportedType, User
+)
+
+Key = tuple[int, int]
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
+def _key(time: datetime.datetime, obj_id: int) -> Key:
+    return int(time.timestamp() * 1000), obj_id
+
+def _page(index: list[Key], offset: int, limit: Optional[int],
+          after: Optional[PageCursor], before: Optional[PageCursor]) -> list[Key]:
+    """Slice a newest-first page out of an ascending ``(time, id)`` index."""
+    if before:
+        start = bisect_right(index, (before.time, before.id))
+        stop = len(index) if limit is None else start + limit
+        return index[start:stop][::-1]
+    if after:
+        stop = bisect_left(index, (after.time, after.id))
+        start = 0 if limit is None else max(0, stop - limit)
+        return index[start:stop][::-1]
+    stop = len(index) - offset
+    start = 0 if limit is None else max(0, stop - limit)
+    return index[start:max(stop, 0)][::-1]
+
+def _discard(index: list[Key], key: Key) -> None:
+    i = bisect_left(index, key)
+    if i < len(index) and index[i] == key:
+        del index[i]
+
+
+@dataclass
+class _UserFile:
+    chat_id: Optional[int]
+    message_id: Optional[int]
+    added_at: datetime.datetime
+
+
+@dataclass
+class _Group:
+    user_id: int
+    name: str
+    created_at: datetime.datetime
+    files: dict[int, int] = field(default_factory=dict)  # file_id -> order
+
+    def ordered(self) -> list[tuple[int, int]]:
+        return sorted((order, file_id) for file_id, order in self.files.items())
+
+
+class MemoryDB(BaseStorage):
+    """
+    Keeps everything in process memory; nothing survives a restart.
+
+    Meant for tests and for benchmarking the transfer path without a
+    database. Every method finishes without awaiting, so each call is atomic
+    on the event loop. Objects are copied on the way in and out, as they
+    would be by a real backend.
+    """
+
+    is_connected: bool = False
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._files: dict[int, FileInfo] = {}
+        self._locations: dict[int, dict[int, InputTypeLocation]] = {}  # file_id -> bot_id -> location
+        self._users: dict[int, User] = {}
+        self._user_files: dict[int, dict[int, _UserFile]] = {}
+        self._user_file_index: dict[int, list[Key]] = {}
+        self._file_users: dict[int, set[int]] = {}
+        self._groups: dict[int, _Group] = {}
+        self._user_group_index: dict[int, list[Key]] = {}
+        self._group_ids = itertools.count(1)
+        self._config: dict[str, SupportedType] = {}
+
+    async def connect(self, **kwargs) -> None:
+        self.is_connected = True
+
+    async def close(self, force: bool = False) -> None:
+        self.is_connected = False
+
+    async def init_db(self) -> None:
+        pass
+
+    # ---------- Files ----------
+
+    def _link(self, user_id: int, file: FileInfo, source: FileSource) -> None:
+        self._files[file.id] = replace(file)
+        files = self._user_files.setdefault(user_id, {})
+        entry = files.get(file.id)
+        if entry is None:
+            entry = files[file.id] = _UserFile(source.chat_id, source.message_id, _now())
+            insort(self._user_file_index.setdefault(user_id, []), _key(entry.added_at, file.id))
+            self._file_users.setdefault(file.id, set()).add(user_id)
+            return
+        if source.chat_id is not None:
+            entry.chat_id = source.chat_id
+        if source.message_id is not None:
+            entry.message_id = source.message_id
+
+    def _unlink(self, user_id: int, file_id: int) -> bool:
+        entry = self._user_files.get(user_id, {}).pop(file_id, None)
+        if entry is None:
+            return False
+        _discard(self._user_file_index[user_id], _key(entry.added_at, file_id))
+        self._file_users[file_id].discard(user_id)
+        for _, group_id in self._user_group_index.get(user_id, []):
+            self._groups[group_id].files.pop(file_id, None)
+        return True
+
+    async def add_file(self, user_id: int, file: FileInfo, source: FileSource) -> None:
+        self._link(user_id, file, source)
+
+    async def update_file_restriction(self, file_id: int, status: bool) -> None:
+        if file_id in self._files:
+            self._files[file_id].is_deleted = status
+
+    async def get_file(self, file_id: int, user_id: Optional[int] = None) -> Optional[FileInfo]:
+        if user_id is not None and file_id not in self._user_files.get(user_id, {}):
+            return None
+        file = self._files.get(file_id)
+        return replace(file) if file else None
+
+    async def get_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
+        return self._locations.get(file.id, {}).get(bot_id)
+
+    async def resolve_stream(self, file_id: int, user_id: int, bot_id: int
+                             ) -> tuple[Optional[FileInfo], Optional[InputTypeLocation]]:
+        file = await self.get_file(file_id, user_id)
+        if file is None:
+            return None, None
+        return file, await self.get_location(file, bot_id)
+
+    async def get_source(self, file_id: int, user_id: int) -> Optional[FileSource]:
+        entry = self._user_files.get(user_id, {}).get(file_id)
+        if entry is None:
+            return None
+        return FileSource(chat_id=entry.chat_id, message_id=entry.message_id, time=entry.added_at)
+
+    async def upsert_location(self, bot_id: int, loc: InputTypeLocation) -> None:
+        self._locations.setdefault(loc.id, {})[bot_id] = loc
+
+    async def upsert_locations(self, items: list[tuple[int, InputTypeLocation]]) -> None:
+        for bot_id, loc in items:
+            self._locations.setdefault(loc.id, {})[bot_id] = loc
+
+    async def get_files(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                        after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+                        ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        keys = _page(self._user_file_index.get(user_id, []), offset, limit, after, before)
+        for time, file_id in keys:
+            yield file_id, str(self._files[file_id].file_name), PageCursor(time, file_id)
+
+    async def get_files2(self, user_id: int, file_ids: list[int], full: bool = False
+                         ) -> AsyncGenerator[FileInfo | tuple[int, str], None]:
+        files = self._user_files.get(user_id, {})
+        found = sorted(
+            {file_id for file_id in file_ids if file_id in files},
+            key=lambda file_id: files[file_id].added_at, reverse=True
+        )
+        for file_id in found:
+            file = self._files[file_id]
+            yield replace(file) if full else (file_id, str(file.file_name))
+
+    async def get_file_users(self, file_id: int, ) -> set[int]:
+        return set(self._file_users.get(file_id, ()))
+
+    async def total_files(self, user_id: int) -> int:
+        return len(self._user_files.get(user_id, {}))
+
+    async def delete_file(self, file_id: int) -> bool:
+        # Same restriction as the USER_FILE foreign key of the SQL backends
+        if self._file_users.get(file_id):
+            raise ValueError(f"File {file_id} is still referenced by a user")
+        self._file_users.pop(file_id, None)
+        self._locations.pop(file_id, None)
+        return self._files.pop(file_id, None) is not None
+
+    async def remove_file(self, file_id: int, user_id: int) -> bool:
+        return self._unlink(user_id, file_id)
+
+    # ---------- Groups ----------
+
+    def _owned_group(self, group_id: int, user_id: int) -> Optional[_Group]:
+        group = self._groups.get(group_id)
+        return group if group is not None and group.user_id == user_id else None
+
+    def _group_info(self, group_id: int, group: _Group, files: list[int]) -> GroupInfo:
+        return GroupInfo(
+            group_id=group_id,
+            user_id=group.user_id,
+            name=group.name,
+            created_at=group.created_at,
+            files=files
+        )
+
+    async def create_group(self, user_id: int, name: str) -> int:
+        group_id = next(self._group_ids)
+        group = self._groups[group_id] = _Group(user_id, name, _now())
+        insort(self._user_group_index.setdefault(user_id, []), _key(group.created_at, group_id))
+        return group_id
+
+    async def add_file_to_group(self, group_id: int, user_id: int, file_id: int, order: Optional[int] = None) -> None:
+        group = self._owned_group(group_id, user_id)
+        if group is None or file_id not in self._user_files.get(user_id, {}):
+            raise KeyError(f"file {file_id} of user {user_id} or group {group_id} does not exist")
+        if order is None:
+            order = max(group.files.values(), default=0) + 1
+        group.files[file_id] = order
+
+    async def add_files_to_group(self, group_id: int, user_id: int, bot_id: int,
+                                 files: list[tuple[FileInfo, FileSource, InputTypeLocation]]) -> None:
+        group = self._owned_group(group_id, user_id)
+        if group is None:
+            raise KeyError(f"group {group_id} of user {user_id} does not exist")
+        start = max(group.files.values(), default=0)
+        for i, (file, source, loc) in enumerate(files, 1):
+            self._link(user_id, file, source)
+            self._locations.setdefault(loc.id, {})[bot_id] = loc
+            group.files[file.id] = start + i
+
+    async def get_groups(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                         after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+    ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        keys = _page(self._user_group_index.get(user_id, []), offset, limit, after, before)
+        for time, group_id in keys:
+            yield group_id, self._groups[group_id].name, PageCursor(time, group_id)
+
+    async def get_group(self, group_id: int, user_id: int) -> Optional[GroupInfo]:
+        group = self._owned_group(group_id, user_id)
+        if group is None:
+            return None
+        return self._group_info(group_id, group, [file_id for _, file_id in group.ordered()])
+
+    def _group_file(self, file_id: int, order: int) -> GroupFile:
+        file = self._files[file_id]
+        return GroupFile(file_id, file.file_name, file.file_size, file.mime_type, order, file.is_deleted)
+
+    async def get_group_with_files(self, group_id: int, user_id: int
+                                   ) -> Optional[tuple[GroupInfo, list[GroupFile]]]:
+        group = self._owned_group(group_id, user_id)
+        if group is None:
+            return None
+        files = [self._group_file(file_id, order) for order, file_id in group.ordered()]
+        return self._group_info(group_id, group, [f.id for f in files]), files
+
+    async def iter_group_files(self, group_id: int, user_id: int, batch_size: int = 500
+                               ) -> AsyncGenerator[GroupFile, None]:
+        group = self._owned_group(group_id, user_id)
+        if group is None:
+            return
+        for order, file_id in group.ordered():
+            # The group may change while the caller is suspended
+            if group.files.get(file_id) == order:
+                yield self._group_file(file_id, order)
+
+    async def get_next_group_file(self, file_id: int, user_id: int) -> Optional[int]:
+        group_ids = sorted((gid for _, gid in self._user_group_index.get(user_id, [])), reverse=True)
+        for group_id in group_ids:
+            group = self._groups[group_id]
+            if file_id not in group.files:
+                continue
+            current = (group.files[file_id], file_id)
+            following = [key for key in group.ordered() if key > current]
+            if following:
+                return following[0][1]
+        return None
+
+    async def delete_group(self, group_id: int, user_id: int) -> None:
+        group = self._owned_group(group_id, user_id)
+        if group is None:
+            return
+        del self._groups[group_id]
+        _discard(self._user_group_index[user_id], _key(group.created_at, group_id))
+
+    async def update_group_name(self, group_id: int, user_id: int, name: str) -> None:
+        group = self._owned_group(group_id, user_id)
+        if group is not None:
+            group.name = name
+
+    async def update_group_order(self, group_id: int, file_id: int, user_id: int, new_order: int) -> None:
+        group = self._owned_group(group_id, user_id)
+        if group is not None and file_id in group.files:
+            group.files[file_id] = new_order
+
+    async def total_groups(self, user_id: int) -> int:
+        return len(self._user_group_index.get(user_id, []))
+
+    # ---------- Users ----------
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        user = self._users.get(user_id)
+        return replace(user) if user else None
+
+    async def add_user(self, user_id: int) -> bool:
+        if user_id in self._users:
+            return False
+        self._users[user_id] = User(user_id=user_id, join_date=_now())
+        return True
+
+    async def upsert_user(self, user: User) -> bool:
+        self._users[user.user_id] = replace(user, join_date=user.join_date or _now())
+        return True
+
+    async def delete_user(self, user_id: int) -> bool:
+        if self._users.pop(user_id, None) is None:
+            return False
+        for file_id in list(self._user_files.get(user_id, ())):
+            self._unlink(user_id, file_id)
+        for _, group_id in self._user_group_index.pop(user_id, []):
+            del self._groups[group_id]
+        self._user_files.pop(user_id, None)
+        self._user_file_index.pop(user_id, None)
+        return True
+
+    async def get_users(self) -> AsyncGenerator[User, None]:
+        for user in list(self._users.values()):
+            yield replace(user)
+
+    async def count_users(self) -> int:
+        return len(self._users)
+
+    async def get_banned_users(self) -> set[int]:
+        return {user_id for user_id, user in self._users.items() if user.is_banned}
+
+    def known_banned(self, user_id: int) -> bool:
+        user = self._users.get(user_id)
+        return user is not None and user.is_banned
+
+    async def recount(self, user_id: Optional[int] = None) -> None:
+        # Totals are read from the indexes directly, there is nothing to rebuild
+        pass
+
+    # ---------- Config ----------
+
+    async def get_secret(self, rotate=False) -> bytes:
+        secret = self._config.get("link.secret")
+        if rotate or secret is None:
+            secret = self._config["link.secret"] = os.urandom(32)
+        return secret
+
+    async def get_config_value(self, key: str) -> Optional[SupportedType]:
+        return copy.deepcopy(self._config.get(key))
+
+    async def set_config_value(self, key: str, value: SupportedType) -> None:
+        self._config[key] = copy.deepcopy(value)
@@ -0,0 +1,135 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Callable, Optional
+
+if TYPE_CHECKING:
+    from tgfs.database.database import BaseStorage
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Migration:
+    """
+    A data migration that ships with ``version`` of the app.
+
+    ``run(state, batch_size)`` is an async generator that does one batch per
+    iteration and yields the state to resume from. The state is stored in
+    the app config under ``migration.<name>`` after every batch, and ``run``
+    is given the last stored one after a restart. ``ready`` is called once
+    the migration has finished, now or on an earlier start.
+    """
+    version: str
+    name: str
+    run: Callable[[dict, int], AsyncGenerator[dict, None]]
+    ready: Optional[Callable[[], None]] = None
+
+    @property
+    def key(self) -> str:
+        return f"migration.{self.name}"
+
+
+class MigrationSkipped(Exception):
+    """Raised by a migration that can not run now, e.g. because another instance is running it."""
+
+
+def parse_version(version: str) -> tuple[int, ...]:
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
+class MigrationRunner:
+    """
+    Runs the pending migrations of a backend in the background, oldest
+    version first, pausing ``delay`` seconds between batches so the server
+    keeps its share of the database. A failed or skipped migration stops the
+    ones after it and is retried from its last batch on the next start.
+
+    Whether a migration is pending is decided by its own done marker only,
+    not by the ``VERSION`` stored in the app config.
+    """
+
+    def __init__(self, db: "BaseStorage", batch_size: int, delay: float) -> None:
+        self.db = db
+        self.batch_size = batch_size
+        self.delay = delay
+        self.current: Optional[str] = None
+        self.batches = 0
+        self.pending: list[str] = []
+        self.failed: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": self.pending,
+            "current": self.current,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+    async def _run(self) -> None:
+        migrations = sorted(self.db.migrations(), key=lambda m: parse_version(m.version))
+        todo = []
+        for migration in migrations:
+            state = await self.db.get_config_value(migration.key) or {}
+            if state.get("done"):
+                if migration.ready:
+                    migration.ready()
+            else:
+                todo.append((migration, state))
+        self.pending = [migration.name for migration, _ in todo]
+
+        for migration, state in todo:
+            self.current = migration.name
+            log.info("Running migration %s (%s)", migration.name, migration.version)
+            try:
+                async with aclosing(migration.run(state, self.batch_size)) as batches:
+                    async for state in batches:
+                        await self.db.set_config_value(migration.key, state)
+                        self.batches += 1
+                        await asyncio.sleep(self.delay)
+                await self.db.set_config_value(migration.key, {**state, "done": True})
+            except MigrationSkipped as e:
+                log.info("Skipped migration %s: %s", migration.name, e)
+                break
+            except Exception: # pylint: disable=W0718
+                log.error("Migration %s failed, it resumes on the next start", migration.name, exc_info=True)
+                self.failed = migration.name
+                break
+            finally:
+                self.current = None
+            self.pending.remove(migration.name)
+            if migration.ready:
+                migration.ready()
+            log.info("Finished migration %s", migration.name)
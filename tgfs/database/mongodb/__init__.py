@@ -16,29 +16,35 @@
 
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
 
+from tgfs.database.cache import CacheDB
+from tgfs.database.write_behind import WriteBehindDB
 from tgfs.database.database import BaseStorage
+from tgfs.database.migration import Migration
 
 from .file import FileDB
 from .group import GroupDB
 from .user import UserDB
 from .utils import UtilDB
 
-class MongoDB(FileDB, GroupDB, UserDB, UtilDB, BaseStorage):
+class MongoDB(CacheDB, WriteBehindDB, FileDB, GroupDB, UserDB, UtilDB, BaseStorage):
     is_connected: bool = False
     client: AsyncIOMotorClient
     db: AsyncIOMotorDatabase
     files: AsyncIOMotorCollection
+    user_files: AsyncIOMotorCollection
     groups: AsyncIOMotorCollection
     users: AsyncIOMotorCollection
     config: AsyncIOMotorCollection
 
-    async def connect(self, uri: str, dbname) -> None: # pylint: disable=W0221
+    async def connect(self, uri: str, dbname, id_block: int = 1) -> None: # pylint: disable=W0221
+        self.id_block = max(1, id_block)
         if not self.is_connected:
             self.client = AsyncIOMotorClient(uri)
             self.is_connected = True
         self.db = self.client[dbname]
 
         self.files  = self.db.files
+        self.user_files = self.db.user_files
         self.groups = self.db.groups
         self.users  = self.db.users
         self.config = self.db.app_config
@@ -50,14 +56,24 @@ class MongoDB(FileDB, GroupDB, UserDB, UtilDB, BaseStorage):
 
     async def init_db(self) -> None:
         await self._create_indexes()
+        # Known before the first request, the runner only starts after init
+        if await self.user_files_done():
+            self.user_files_migrated()
+
+    def migrations(self) -> list[Migration]:
+        return [
+            Migration("0.0.1", "user_files", self.migrate_user_files, self.user_files_migrated),
+        ]
 
     async def _create_indexes(self) -> None:
-        await self.files.create_index("users.user_id")
         await self.files.create_index("is_deleted")
-        await self.files.create_index("users.added_at")
+
+        await self.user_files.create_index([("user_id", 1), ("file_id", 1)], unique=True)
+        await self.user_files.create_index([("user_id", 1), ("added_at", -1), ("file_id", -1)])
+        await self.user_files.create_index("file_id")
 
         await self.groups.create_index("user_id")
-        await self.groups.create_index([("user_id", 1), ("created_at", -1)])
+        await self.groups.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
 
         await self.users.create_index("ban_date")
         await self.users.create_index("warns")
@@ -14,42 +14,115 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
 from datetime import datetime, timezone
 from typing import AsyncGenerator, Optional, Union
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from telethon.tl.types import InputDocumentFileLocation, InputPhotoFileLocation
 
 from tgfs.database.database import BaseStorage
-from tgfs.utils.types import FileInfo, FileSource, InputTypeLocation
+from tgfs.utils.types import FileInfo, FileSource, InputTypeLocation, PageCursor
+
+from .utils import bump_counters, iter_page, keyset_filter, read_counters, to_millis
+
+log = logging.getLogger(__name__)
+
+USER_FILES_MIGRATION = "migration.user_files"
+
+FILE_PROJECTION = {
+    "dc_id": 1, "size": 1, "mime_type": 1, "file_name": 1,
+    "thumb_size": 1, "is_deleted": 1,
+}
+
+
+def doc_to_file(doc: dict) -> FileInfo:
+    return FileInfo(
+        id=doc["_id"],
+        dc_id=doc["dc_id"],
+        file_size=doc["size"],
+        mime_type=doc.get("mime_type"),
+        file_name=doc.get("file_name"),
+        thumb_size=doc.get("thumb_size"),
+        is_deleted=bool(doc.get("is_deleted", False)),
+    )
+
+
+def lookup_file(projection: Optional[dict]) -> list[dict]:
+    """Pipeline stages joining each ``user_files`` entry with its file document."""
+    return [
+        {"$lookup": {
+            "from": "files",
+            "localField": "file_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": projection or FILE_PROJECTION}],
+            "as": "file",
+        }},
+        {"$unwind": "$file"},
+    ]
 
 
 class FileDB(BaseStorage):
+    """
+    File documents and the per-user links to them.
+
+    Links live in the ``user_files`` collection, one document per
+    (user_id, file_id) with compound indexes for listing and ownership
+    checks. Older databases kept them in a ``users.{user_id}`` map on each
+    file, which can not be indexed; until :meth:`migrate_user_files` is
+    marked done in the config, that map is still written alongside
+    ``user_files`` and serves reads. Afterwards links are only added to
+    ``user_files``, but removed links are still cleared from the map so an
+    instance that is still copying it can not bring them back.
+    """
     db: AsyncIOMotorDatabase
     files: AsyncIOMotorCollection
+    user_files: AsyncIOMotorCollection
     groups: AsyncIOMotorCollection
+    users: AsyncIOMotorCollection
+    config: AsyncIOMotorCollection
+    user_files_ready: bool = False
 
     async def add_file(self, user_id: int, file: FileInfo, source: FileSource) -> None:
-        await self.files.update_one(
+        now = datetime.now(timezone.utc)
+        link = {
+            "chat_id": source.chat_id,
+            "message_id": source.message_id,
+            "added_at": now,
+        }
+        fields = {
+            "dc_id": file.dc_id,
+            "size": file.file_size,
+            "mime_type": file.mime_type,
+            "file_name": file.file_name,
+            "thumb_size": file.thumb_size,
+            "is_deleted": file.is_deleted,
+        }
+        if self.user_files_ready:
+            await self.files.update_one({"_id": file.id}, {"$set": fields}, upsert=True)
+            res = await self.user_files.update_one(
+                {"user_id": user_id, "file_id": file.id}, {"$set": link}, upsert=True,
+            )
+            if res.upserted_id is not None:
+                await bump_counters(self.users, user_id, files=1)
+            return
+
+        # The legacy map is written first; see migrate_user_files
+        before = await self.files.find_one_and_update(
             {"_id": file.id},
-            {
-                "$set": {
-                    "dc_id": file.dc_id,
-                    "size": file.file_size,
-                    "mime_type": file.mime_type,
-                    "file_name": file.file_name,
-                    "thumb_size": file.thumb_size,
-                    "is_deleted": file.is_deleted,
-                    f"users.{user_id}": {
-                        "chat_id": source.chat_id,
-                        "message_id": source.message_id,
-                        "added_at": datetime.now(timezone.utc),
-                    },
-                }
-            },
+            {"$set": {**fields, f"users.{user_id}": link}},
+            projection={f"users.{user_id}": 1},
             upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        await self.user_files.update_one(
+            {"user_id": user_id, "file_id": file.id}, {"$set": link}, upsert=True,
         )
+        if not before or str(user_id) not in before.get("users", {}):
+            await bump_counters(self.users, user_id, files=1)
 
     async def update_file_restriction(self, file_id: int, status: bool) -> None:
         await self.files.update_one(
@@ -57,24 +130,29 @@ class FileDB(BaseStorage):
             {"$set": {"is_deleted": status}},
         )
 
-    async def get_file(self, file_id: int, user_id: Optional[int] = None) -> Optional[FileInfo]:
-        query = {"_id": file_id}
-        if user_id is not None:
-            query[f"users.{user_id}"] = {"$exists": True}
+    async def _find_owned(self, file_id: int, user_id: int, projection: dict) -> Optional[dict]:
+        if not self.user_files_ready:
+            return await self.files.find_one(
+                {"_id": file_id, f"users.{user_id}": {"$exists": True}},
+                projection,
+            )
+        async for doc in self.user_files.aggregate([
+            {"$match": {"user_id": user_id, "file_id": file_id}},
+            {"$limit": 1},
+            *lookup_file(projection),
+        ]):
+            return doc["file"]
+        return None
 
-        doc = await self.files.find_one(query)
+    async def get_file(self, file_id: int, user_id: Optional[int] = None) -> Optional[FileInfo]:
+        if user_id is None:
+            doc = await self.files.find_one({"_id": file_id}, FILE_PROJECTION)
+        else:
+            doc = await self._find_owned(file_id, user_id, FILE_PROJECTION)
         if not doc:
             return None
 
-        return FileInfo(
-            id=doc["_id"],
-            dc_id=doc["dc_id"],
-            file_size=doc["size"],
-            mime_type=doc.get("mime_type"),
-            file_name=doc.get("file_name"),
-            thumb_size=doc.get("thumb_size"),
-            is_deleted=bool(doc.get("is_deleted", False)),
-        )
+        return doc_to_file(doc)
 
     async def get_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
         doc = await self.files.find_one(
@@ -93,15 +171,39 @@ class FileDB(BaseStorage):
             thumb_size=file.thumb_size,
         )
 
-    async def get_source(self, file_id: int, user_id: int) -> Optional[FileSource]:
-        doc = await self.files.find_one(
-            {"_id": file_id, f"users.{user_id}": {"$exists": True}},
-            {f"users.{user_id}": 1},
+    async def resolve_stream(self, file_id: int, user_id: int, bot_id: int
+                             ) -> tuple[Optional[FileInfo], Optional[InputTypeLocation]]:
+        doc = await self._find_owned(
+            file_id, user_id, {**FILE_PROJECTION, f"location.{bot_id}": 1}
         )
         if not doc:
+            return None, None
+
+        file = doc_to_file(doc)
+        loc = doc.get("location", {}).get(str(bot_id))
+        if not loc:
+            return file, None
+
+        cls = InputPhotoFileLocation if file.thumb_size else InputDocumentFileLocation
+        return file, cls(
+            id=file.id,
+            access_hash=loc["access_hash"],
+            file_reference=loc["file_reference"],
+            thumb_size=file.thumb_size,
+        )
+
+    async def get_source(self, file_id: int, user_id: int) -> Optional[FileSource]:
+        if self.user_files_ready:
+            u = await self.user_files.find_one({"user_id": user_id, "file_id": file_id})
+        else:
+            doc = await self.files.find_one(
+                {"_id": file_id, f"users.{user_id}": {"$exists": True}},
+                {f"users.{user_id}": 1},
+            )
+            u = doc["users"][str(user_id)] if doc else None
+        if not u:
             return None
 
-        u = doc["users"][str(user_id)]
         return FileSource(
             chat_id=u["chat_id"],
             message_id=u["message_id"],
@@ -121,21 +223,67 @@ class FileDB(BaseStorage):
             },
         )
 
+    async def upsert_locations(self, items: list[tuple[int, InputTypeLocation]]) -> None:
+        if not items:
+            return
+        await self.files.bulk_write([
+            UpdateOne(
+                {"_id": loc.id},
+                {
+                    "$set": {
+                        f"location.{bot_id}": {
+                            "access_hash": loc.access_hash,
+                            "file_reference": loc.file_reference,
+                        }
+                    }
+                },
+            )
+            for bot_id, loc in items
+        ], ordered=False)
+
     async def get_files(
-        self, user_id: int, offset: int = 0, limit: Optional[int] = None
-    ) -> AsyncGenerator[tuple[int, str], None]:
+        self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+        after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+    ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        if not self.user_files_ready:
+            async for item in self._get_files_legacy(user_id, offset, limit, after, before):
+                yield item
+            return
+
+        keyset, order = keyset_filter("added_at", after, before, "file_id")
+        pipeline = [
+            {"$match": {"user_id": user_id, **keyset}},
+            {"$sort": {"added_at": order, "file_id": order}},
+        ]
+        if offset and not keyset:
+            pipeline.append({"$skip": offset})
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+        pipeline.extend(lookup_file({"file_name": 1}))
+
+        async for doc in iter_page(self.user_files.aggregate(pipeline), before):
+            yield doc["file_id"], doc["file"].get("file_name"), PageCursor(
+                to_millis(doc["added_at"]), doc["file_id"])
+
+    async def _get_files_legacy(
+        self, user_id: int, offset: int, limit: Optional[int],
+        after: Optional[PageCursor], before: Optional[PageCursor]
+    ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        added_at = f"users.{user_id}.added_at"
+        keyset, order = keyset_filter(added_at, after, before)
         cursor = self.files.find(
-            {f"users.{user_id}": {"$exists": True}},
-            {"file_name": 1, f"users.{user_id}.added_at": 1},
-        ).sort(f"users.{user_id}.added_at", -1)
+            {f"users.{user_id}": {"$exists": True}, **keyset},
+            {"file_name": 1, added_at: 1},
+        ).sort([(added_at, order), ("_id", order)])
 
-        if offset:
+        if offset and not keyset:
             cursor = cursor.skip(offset)
         if limit is not None:
             cursor = cursor.limit(limit)
 
-        async for doc in cursor:
-            yield doc["_id"], doc.get("file_name")
+        async for doc in iter_page(cursor, before):
+            yield doc["_id"], doc.get("file_name"), PageCursor(
+                to_millis(doc["users"][str(user_id)]["added_at"]), doc["_id"])
 
     async def get_files2(
         self, user_id: int, file_ids: list[int], full: bool = False,
@@ -144,37 +292,36 @@ class FileDB(BaseStorage):
         if not file_ids:
             return
 
-        projection = None
-        if not full:
-            projection = {
-                "file_name": 1,
-                f"users.{user_id}.added_at": 1,
-            }
-
-        cursor = self.files.find(
-            {
-                "_id": {"$in": file_ids},
-                f"users.{user_id}": {"$exists": True},
-            },
-            projection,
-        ).sort(f"users.{user_id}.added_at", -1)
+        if self.user_files_ready:
+            cursor = self.user_files.aggregate([
+                {"$match": {"user_id": user_id, "file_id": {"$in": file_ids}}},
+                {"$sort": {"added_at": -1}},
+                *lookup_file(None if full else {"file_name": 1}),
+                {"$replaceRoot": {"newRoot": "$file"}},
+            ])
+        else:
+            cursor = self.files.find(
+                {
+                    "_id": {"$in": file_ids},
+                    f"users.{user_id}": {"$exists": True},
+                },
+                FILE_PROJECTION if full else {"file_name": 1},
+            ).sort(f"users.{user_id}.added_at", -1)
 
         if full:
             async for doc in cursor:
-                yield FileInfo(
-                    id=doc["_id"],
-                    dc_id=doc["dc_id"],
-                    file_size=doc["size"],
-                    mime_type=doc.get("mime_type"),
-                    file_name=doc.get("file_name"),
-                    thumb_size=doc.get("thumb_size"),
-                    is_deleted=bool(doc.get("is_deleted", False)),
-                )
+                yield doc_to_file(doc)
         else:
             async for doc in cursor:
                 yield doc["_id"], doc.get("file_name")
 
     async def get_file_users(self, file_id: int) -> set[int]:
+        if self.user_files_ready:
+            return {
+                doc["user_id"]
+                async for doc in self.user_files.find({"file_id": file_id}, {"user_id": 1})
+            }
+
         doc = await self.files.find_one(
             {"_id": file_id},
             {"users": 1},
@@ -185,13 +332,24 @@ class FileDB(BaseStorage):
         return {int(uid) for uid in doc["users"].keys()}
 
     async def total_files(self, user_id: int) -> int:
-        return await self.files.count_documents(
-            {f"users.{user_id}": {"$exists": True}}
-        )
+        files, _ = await read_counters(self, user_id)
+        return files
 
     async def delete_file(self, file_id: int) -> bool:
-        res = await self.files.delete_one({"_id": file_id})
-        return res.deleted_count > 0
+        doc = await self.files.find_one_and_delete({"_id": file_id}, {"users": 1})
+        if self.user_files_ready:
+            user_ids = {
+                link["user_id"]
+                async for link in self.user_files.find({"file_id": file_id}, {"user_id": 1})
+            }
+        else:
+            user_ids = {int(uid) for uid in (doc or {}).get("users", {})}
+        await self.user_files.delete_many({"file_id": file_id})
+        if not doc:
+            return False
+        for user_id in user_ids:
+            await bump_counters(self.users, user_id, files=-1)
+        return True
 
     async def _delete_file_from_group(self, user_id: int, file_id: int,) -> None:
         await self.groups.update_one(
@@ -207,12 +365,100 @@ class FileDB(BaseStorage):
         )
 
     async def remove_file(self, file_id: int, user_id: int) -> bool:
+        # The map is cleared first and even after the migration; see FileDB
         res = await self.files.update_one(
             {"_id": file_id},
             {"$unset": {f"users.{user_id}": ""}},
         )
+        link = await self.user_files.delete_one({"user_id": user_id, "file_id": file_id})
+        removed = link.deleted_count > 0 if self.user_files_ready else res.modified_count > 0
+        if removed:
+            await bump_counters(self.users, user_id, files=-1)
         await self._delete_file_from_group(user_id, file_id)
-        return res.modified_count > 0
+        return removed
+
+    async def migrate_user_files(self, state: dict, batch_size: int) -> AsyncGenerator[dict, None]:
+        """
+        Copy the legacy ``users`` maps into ``user_files`` in batches.
+
+        Several instances may run it at the same time. Writers update the
+        map before ``user_files``, so after copying a batch the links that
+        are present in ``user_files`` but no longer in the map were removed
+        concurrently and are deleted again. Until the migration is marked
+        done every writer keeps the map up to date. Each batch first checks
+        that marker and stops once another instance has set it, so links
+        added only to ``user_files`` afterwards are never older than the
+        batch and are kept.
+        """
+        if not state:
+            # Progress stored before the migration runner existed
+            legacy = await self.config.find_one({"_id": USER_FILES_MIGRATION}) or {}
+            if legacy.get("done"):
+                return
+            state = {"last": legacy.get("last")}
+        last = state.get("last")
+        while True:
+            started = datetime.now(timezone.utc)
+            if await self.user_files_done():
+                return
+            query = {"users": {"$type": "object"}}
+            if last is not None:
+                query["_id"] = {"$gt": last}
+            docs = await self.files.find(query, {"users": 1}) \
+                .sort("_id", 1).limit(batch_size).to_list(length=None)
+            if not docs:
+                break
+
+            ops = [
+                UpdateOne(
+                    {"user_id": int(uid), "file_id": doc["_id"]},
+                    {"$setOnInsert": {
+                        "chat_id": u.get("chat_id"),
+                        "message_id": u.get("message_id"),
+                        "added_at": u.get("added_at"),
+                    }},
+                    upsert=True,
+                )
+                for doc in docs
+                for uid, u in doc["users"].items()
+            ]
+            if ops:
+                try:
+                    await self.user_files.bulk_write(ops, ordered=False)
+                except BulkWriteError as e:
+                    # Lost an upsert race against a writer or another instance
+                    if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                        raise
+
+            ids = [doc["_id"] for doc in docs]
+            copied = await self.user_files.find(
+                {"file_id": {"$in": ids}, "added_at": {"$lt": started}}, {"user_id": 1, "file_id": 1}
+            ).to_list(length=None)
+            linked = {
+                (int(uid), doc["_id"])
+                async for doc in self.files.find({"_id": {"$in": ids}}, {"users": 1})
+                for uid in doc.get("users", {})
+            }
+            stale = [
+                DeleteOne({"_id": doc["_id"]})
+                for doc in copied
+                if (doc["user_id"], doc["file_id"]) not in linked
+            ]
+            if stale:
+                await self.user_files.bulk_write(stale, ordered=False)
+
+            last = ids[-1]
+            log.debug("Copied user links up to file %d", last)
+            yield {"last": last}
+
+    async def user_files_done(self) -> bool:
+        """Whether the user_files migration is marked done in the config."""
+        doc = await self.config.find_one({"_id": USER_FILES_MIGRATION}) or {}
+        # Progress stored before the migration runner existed is not under "value"
+        return bool(doc.get("done") or (doc.get("value") or {}).get("done"))
+
+    def user_files_migrated(self) -> None:
+        self.user_files_ready = True
 
     async def get_file_old(self, file_id: str, user_id: int = None) -> Optional[dict[str, Union[ObjectId, int]]]:
         query = {"_id": ObjectId(file_id)}
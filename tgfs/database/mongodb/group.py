@@ -14,37 +14,58 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 from typing import AsyncGenerator, Optional
 from datetime import datetime, timezone
 
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, UpdateOne
 from motor.motor_asyncio import AsyncIOMotorCollection
 
 from tgfs.database.database import BaseStorage
-from tgfs.utils.types import GroupInfo
+from tgfs.utils.types import FileInfo, FileSource, GroupFile, GroupInfo, InputTypeLocation, PageCursor
+
+from .utils import bump_counters, iter_page, keyset_filter, read_counters, to_millis
 
 class GroupDB(BaseStorage):
+    files: AsyncIOMotorCollection
+    user_files: AsyncIOMotorCollection
     groups: AsyncIOMotorCollection
+    users: AsyncIOMotorCollection
     config: AsyncIOMotorCollection
+    user_files_ready: bool = False
+    id_block: int = 1
+    _next_group_id: int = 1
+    _last_group_id: int = 0
+    _group_id_lock: Optional[asyncio.Lock] = None
 
     async def group_counter(self) -> int:
         """
-        Generate the next sequential group ID using atomic MongoDB counter pattern.
+        Generate the next group ID using hi-lo allocation.
 
-        Uses atomic find_one_and_update operation to increment a counter document
-        in the config collection. If the counter doesn't exist, it's created with
-        initial value 1 (upsert=True).
+        One atomic ``$inc`` of the counter document in the config collection
+        reserves a block of ``id_block`` IDs for this process, which are then
+        handed out locally. IDs are unique across instances but only increase
+        within a process, and the unused rest of a block is skipped on
+        restart.
 
         Returns:
-            int: Next group ID (incrementing sequence starting from 1)
+            int: Next group ID
         """
-        result = await self.config.find_one_and_update(
-            {"_id": "group.counter"},
-            {"$inc": {"value": 1}},
-            upsert=True,
-            return_document=ReturnDocument.AFTER,
-        )
-        return result["value"]
+        if self._group_id_lock is None:
+            self._group_id_lock = asyncio.Lock()
+        async with self._group_id_lock:
+            if self._next_group_id > self._last_group_id:
+                result = await self.config.find_one_and_update(
+                    {"_id": "group.counter"},
+                    {"$inc": {"value": self.id_block}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                self._last_group_id = result["value"]
+                self._next_group_id = self._last_group_id - self.id_block + 1
+            group_id = self._next_group_id
+            self._next_group_id += 1
+            return group_id
 
     async def create_group(self, user_id: int, name: str) -> int:
         group_id = await self.group_counter()
@@ -55,6 +76,7 @@ class GroupDB(BaseStorage):
             "created_at": datetime.now(timezone.utc),
             "files": {},
         })
+        await bump_counters(self.users, user_id, groups=1)
         return group_id
 
     async def add_file_to_group(
@@ -84,24 +106,92 @@ class GroupDB(BaseStorage):
             upsert=False,
         )
 
-    async def get_groups(
-        self, user_id: int, offset: int = 0, limit: Optional[int] = None
-    ) -> AsyncGenerator[tuple[int, str], None]:
+    async def add_files_to_group(self, group_id: int, user_id: int, bot_id: int,
+                                 files: list[tuple[FileInfo, FileSource, InputTypeLocation]]) -> None:
+        if not files:
+            return
+        doc = await self.groups.find_one(
+            {"_id": group_id, "user_id": user_id},
+            {"files": 1},
+        )
+        start = len(doc["files"]) if doc and "files" in doc else 0
+        now = datetime.now(timezone.utc)
+        file_ids = list({file.id for file, _, _ in files})
+        if self.user_files_ready:
+            existing = await self.user_files.count_documents(
+                {"user_id": user_id, "file_id": {"$in": file_ids}}
+            )
+        else:
+            existing = await self.files.count_documents(
+                {"_id": {"$in": file_ids}, f"users.{user_id}": {"$exists": True}}
+            )
 
-        cursor = (
-            self.groups.find(
-                {"user_id": user_id},
-                {"name": 1},
+        def fields(file: FileInfo, source: FileSource, loc: InputTypeLocation) -> dict:
+            doc = {
+                "dc_id": file.dc_id,
+                "size": file.file_size,
+                "mime_type": file.mime_type,
+                "file_name": file.file_name,
+                "thumb_size": file.thumb_size,
+                "is_deleted": file.is_deleted,
+                f"location.{bot_id}": {
+                    "access_hash": loc.access_hash,
+                    "file_reference": loc.file_reference,
+                },
+            }
+            if not self.user_files_ready:
+                doc[f"users.{user_id}"] = {
+                    "chat_id": source.chat_id,
+                    "message_id": source.message_id,
+                    "added_at": now,
+                }
+            return doc
+
+        await self.files.bulk_write([
+            UpdateOne({"_id": file.id}, {"$set": fields(file, source, loc)}, upsert=True)
+            for file, source, loc in files
+        ], ordered=False)
+        await self.user_files.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "file_id": file.id},
+                {"$set": {
+                    "chat_id": source.chat_id,
+                    "message_id": source.message_id,
+                    "added_at": now,
+                }},
+                upsert=True,
             )
-            .sort("created_at", -1)
-            .skip(offset)
+            for file, source, _ in files
+        ], ordered=False)
+        await bump_counters(self.users, user_id, files=len(file_ids) - existing)
+
+        await self.groups.update_one(
+            {"_id": group_id, "user_id": user_id},
+            {
+                "$set": {
+                    f"files.{file.id}": {"order": start + i}
+                    for i, (file, _, _) in enumerate(files, 1)
+                }
+            },
         )
 
+    async def get_groups(
+        self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+        after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+    ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        keyset, order = keyset_filter("created_at", after, before)
+        cursor = self.groups.find(
+            {"user_id": user_id, **keyset},
+            {"name": 1, "created_at": 1},
+        ).sort([("created_at", order), ("_id", order)])
+
+        if offset and not keyset:
+            cursor = cursor.skip(offset)
         if limit is not None:
             cursor = cursor.limit(limit)
 
-        async for doc in cursor:
-            yield doc["_id"], doc["name"]
+        async for doc in iter_page(cursor, before):
+            yield doc["_id"], doc["name"], PageCursor(to_millis(doc["created_at"]), doc["_id"])
 
     async def get_group(self, group_id: int, user_id: int) -> Optional[GroupInfo]:
         doc = await self.groups.find_one(
@@ -126,10 +216,98 @@ class GroupDB(BaseStorage):
             files=files
         )
 
+    @staticmethod
+    def _group_files_pipeline(group_id: int, user_id: int) -> list[dict]:
+        """One document per group file, in order, joined with its file."""
+        return [
+            {"$match": {"_id": group_id, "user_id": user_id}},
+            {"$project": {
+                "user_id": 1, "name": 1, "created_at": 1,
+                "files": {"$objectToArray": {"$ifNull": ["$files", {}]}},
+            }},
+            {"$unwind": {"path": "$files", "preserveNullAndEmptyArrays": True}},
+            {"$addFields": {
+                "file_id": {"$toLong": "$files.k"},
+                "order": "$files.v.order",
+            }},
+            {"$sort": {"order": 1, "file_id": 1}},
+            {"$lookup": {
+                "from": "files",
+                "localField": "file_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {
+                    "file_name": 1, "size": 1, "mime_type": 1, "is_deleted": 1,
+                }}],
+                "as": "file",
+            }},
+            {"$project": {"files": 0}},
+        ]
+
+    @staticmethod
+    def _group_file(doc: dict) -> Optional[GroupFile]:
+        if not doc.get("file"):
+            return None
+        file = doc["file"][0]
+        return GroupFile(
+            id=file["_id"],
+            file_name=file.get("file_name"),
+            file_size=file["size"],
+            mime_type=file.get("mime_type"),
+            order=doc["order"],
+            is_deleted=bool(file.get("is_deleted", False)),
+        )
+
+    async def get_group_with_files(self, group_id: int, user_id: int
+                                   ) -> Optional[tuple[GroupInfo, list[GroupFile]]]:
+        docs = await self.groups.aggregate(
+            self._group_files_pipeline(group_id, user_id)
+        ).to_list(length=None)
+        if not docs:
+            return None
+
+        files = [f for f in map(self._group_file, docs) if f is not None]
+        doc = docs[0]
+        return GroupInfo(
+            group_id=doc["_id"],
+            user_id=doc["user_id"],
+            name=doc["name"],
+            created_at=doc["created_at"],
+            files=[f.id for f in files]
+        ), files
+
+    async def iter_group_files(self, group_id: int, user_id: int, batch_size: int = 500
+                               ) -> AsyncGenerator[GroupFile, None]:
+        cursor = self.groups.aggregate(
+            self._group_files_pipeline(group_id, user_id), batchSize=batch_size
+        )
+        async for doc in cursor:
+            file = self._group_file(doc)
+            if file is not None:
+                yield file
+
+    async def get_next_group_file(self, file_id: int, user_id: int) -> Optional[int]:
+        doc = await self.groups.find_one(
+            {"user_id": user_id, f"files.{file_id}": {"$exists": True}},
+            {"files": 1},
+            sort=[("created_at", -1), ("_id", -1)],
+        )
+        if not doc:
+            return None
+
+        current = (doc["files"][str(file_id)]["order"], file_id)
+        following = [
+            (f["order"], int(fid))
+            for fid, f in doc["files"].items()
+            if (f["order"], int(fid)) > current
+        ]
+        return min(following)[1] if following else None
+
     async def delete_group(self, group_id: int, user_id: int) -> None:
-        await self.groups.delete_one(
+        res = await self.groups.delete_one(
             {"_id": group_id, "user_id": user_id}
         )
+        if res.deleted_count:
+            await bump_counters(self.users, user_id, groups=-1)
 
     async def update_group_name(self, group_id: int, user_id: int, name: str) -> None:
         await self.groups.update_one(
@@ -154,6 +332,5 @@ class GroupDB(BaseStorage):
         )
 
     async def total_groups(self, user_id: int) -> int:
-        return await self.groups.count_documents(
-            {"user_id": user_id}
-        )
+        _, groups = await read_counters(self, user_id)
+        return groups
@@ -93,3 +93,7 @@ class UserDB(BaseStorage):
 
     async def count_users(self) -> int:
         return await self.users.count_documents({})
+
+    async def get_banned_users(self) -> set[int]:
+        cursor = self.users.find({"ban_date": {"$ne": None}}, {"_id": 1})
+        return {int(doc["_id"]) async for doc in cursor}
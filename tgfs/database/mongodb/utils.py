@@ -15,15 +15,92 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncGenerator, Optional
 
 from motor.motor_asyncio import AsyncIOMotorCollection
 from bson.binary import Binary
+from pymongo import UpdateOne
 
 from tgfs.database.database import BaseStorage
+from tgfs.utils.types import PageCursor
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_millis(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(milliseconds=1)
+
+def from_millis(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=ms)
+
+def keyset_filter(time_field: str, after: Optional[PageCursor],
+                  before: Optional[PageCursor], id_field: str = "_id") -> tuple[dict, int]:
+    """
+    Build the filter and sort direction for a newest-first keyset page.
+    Pages before a cursor are read in ascending order and must be reversed
+    by the caller.
+    """
+    cursor = after or before
+    if cursor is None:
+        return {}, -1
+    op, order = ("$lt", -1) if after else ("$gt", 1)
+    time = from_millis(cursor.time)
+    return {"$or": [
+        {time_field: {op: time}},
+        {time_field: time, id_field: {op: cursor.id}},
+    ]}, order
+
+async def iter_page(cursor: Any, before: Optional[PageCursor]) -> AsyncGenerator[dict, None]:
+    """
+    Stream the documents of a keyset page newest first. Only pages before a
+    cursor, which arrive in ascending order, are buffered to be reversed.
+    """
+    if before:
+        for doc in reversed(await cursor.to_list(length=None)):
+            yield doc
+        return
+    async for doc in cursor:
+        yield doc
+
+# Counters live on the user document and are only bumped once they exist;
+# they are created from a full count the first time they are read.
+async def bump_counters(users: AsyncIOMotorCollection, user_id: int,
+                        files: int = 0, groups: int = 0) -> None:
+    await users.update_one(
+        {"_id": user_id, "file_count": {"$exists": True}},
+        {"$inc": {"file_count": files, "group_count": groups}},
+    )
+
+async def recount_user(db: "UtilDB", user_id: int) -> tuple[int, int]:
+    if db.user_files_ready:
+        files = await db.user_files.count_documents({"user_id": user_id})
+    else:
+        files = await db.files.count_documents({f"users.{user_id}": {"$exists": True}})
+    counts = (files, await db.groups.count_documents({"user_id": user_id}))
+    await db.users.update_one(
+        {"_id": user_id},
+        {"$set": {"file_count": counts[0], "group_count": counts[1]}},
+    )
+    return counts
+
+async def read_counters(db: "UtilDB", user_id: int) -> tuple[int, int]:
+    """Return ``(files, groups)`` for the user, initialising the counters if needed."""
+    doc = await db.users.find_one({"_id": user_id}, {"file_count": 1, "group_count": 1})
+    if doc is None or "file_count" not in doc:
+        return await recount_user(db, user_id)
+    return doc["file_count"], doc["group_count"]
 
 
 class UtilDB(BaseStorage):
     config: AsyncIOMotorCollection
+    files: AsyncIOMotorCollection
+    user_files: AsyncIOMotorCollection
+    groups: AsyncIOMotorCollection
+    users: AsyncIOMotorCollection
+    user_files_ready: bool = False
+
     async def get_secret(self, rotate: bool = False) -> bytes:
         if not rotate:
             doc = await self.config.find_one({"_id": "link.secret"})
@@ -42,7 +119,7 @@ class UtilDB(BaseStorage):
 
     async def get_config_value(self, key: str):
         doc = await self.config.find_one({"_id": key})
-        return doc["value"] if doc else None
+        return doc.get("value") if doc else None
 
     async def set_config_value(self, key: str, value):
         await self.config.update_one(
@@ -50,3 +127,35 @@ class UtilDB(BaseStorage):
             {"$set": {"value": value}},
             upsert=True,
         )
+
+    async def recount(self, user_id: Optional[int] = None) -> None:
+        if user_id is not None:
+            await recount_user(self, user_id)
+            return
+
+        if self.user_files_ready:
+            links = self.user_files.aggregate([
+                {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+            ])
+        else:
+            links = self.files.aggregate([
+                {"$project": {"users": {"$objectToArray": "$users"}}},
+                {"$unwind": "$users"},
+                {"$group": {"_id": "$users.k", "n": {"$sum": 1}}},
+            ])
+        file_counts = {int(doc["_id"]): doc["n"] async for doc in links}
+        group_counts = {
+            doc["_id"]: doc["n"]
+            async for doc in self.groups.aggregate([
+                {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+            ])
+        }
+        requests = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {
+                "file_count": file_counts.get(doc["_id"], 0),
+                "group_count": group_counts.get(doc["_id"], 0),
+            }})
+            async for doc in self.users.find({}, {"_id": 1})
+        ]
+        if requests:
+            await self.users.bulk_write(requests, ordered=False)
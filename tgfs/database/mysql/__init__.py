@@ -14,55 +14,85 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from pathlib import Path
+from typing import Any, AsyncGenerator
 import warnings
 
 import aiomysql
 
+from tgfs.database.cache import CacheDB
+from tgfs.database.migration import Migration
+from tgfs.database.write_behind import WriteBehindDB
+
 from .file import FileDB
 from .user import UserDB
 from .group import GroupDB
-from .utils import UtilDB
-
-
-def read_sql_file(path: str) -> list[str]:
-    sql = Path(path).read_text(encoding="utf-8")
-    statements = []
-    buffer = []
-
-    for line in sql.splitlines():
-        line = line.strip()
-        if not line or line.startswith("--"):
-            continue
-
-        buffer.append(line)
-        if line.endswith(";"):
-            statements.append(" ".join(buffer))
-            buffer.clear()
-
-    return statements
-
-class MySQLDB(FileDB, GroupDB, UserDB, UtilDB):
-    _pool: aiomysql.Pool
+from .partition import PartitionDB
+from .pool import MeteredPool
+from .replica import ReplicaSet
+from .utils import UtilDB, migration_lock, read_sql_file
+
+# Indexes added after the first release; CREATE TABLE IF NOT EXISTS does not
+# add them to existing tables, the "indexes" migration does.
+INDEXES = (
+    ("USER_FILE", "idx_user_file_added", "(user_id, added_at)"),
+    ("FILE_GROUP", "idx_file_group_created", "(user_id, created_at)"),
+    ("FILE_GROUP_FILE", "idx_group_file_order", "(group_id, order_index, id)"),
+    ("TGUSER", "idx_user_ban", "(ban_date)"),
+)
+
+class MySQLDB(CacheDB, WriteBehindDB, FileDB, GroupDB, UserDB, UtilDB, PartitionDB):
+    _pool: MeteredPool
     is_connected: bool = False
 
     async def connect(self, *, host: str, port: int = 3306, user: str, password: str,  # pylint: disable=W0221
                           db: str, minsize: int = 1, maxsize: int = 10, autocommit: bool = False,
-                          connect_timeout: int = 10) -> None:
+                          connect_timeout: int = 10, replica_hosts: str = "", replica_user: str = "",
+                          replica_password: str = "", replica_window: int = 5, partitions: int = 0) -> None:
+        self.partitions = max(0, partitions)
+        self._lock_params = dict(
+            host=host, port=port, user=user, password=password, db=db,
+            connect_timeout=connect_timeout, charset="utf8mb4"
+        )
         if not self.is_connected:
-            self._pool = await aiomysql.create_pool(
+            self._pool = MeteredPool(await aiomysql.create_pool(
                 host=host, port=port, user=user, password=password, db=db,
                 minsize=minsize, maxsize=maxsize, autocommit=autocommit,
                 connect_timeout=connect_timeout, charset="utf8mb4"
-            )
+            ))
+            replicas = []
+            for address in filter(None, (h.strip() for h in replica_hosts.split(","))):
+                r_host, _, r_port = address.partition(":")
+                replicas.append(MeteredPool(await aiomysql.create_pool(
+                    host=r_host, port=int(r_port or port),
+                    user=replica_user or user, password=replica_password or password, db=db,
+                    minsize=minsize, maxsize=maxsize, autocommit=autocommit,
+                    connect_timeout=connect_timeout, charset="utf8mb4"
+                )))
+            self._replicas = ReplicaSet(self._pool, replicas, replica_window)
             self.is_connected = True
 
     async def close(self, force: bool = False) -> None:
         if self.is_connected or force:
+            await self._replicas.close()
             self._pool.close()
             await self._pool.wait_closed()
             self.is_connected = False
 
+    def stats(self) -> dict[str, Any]:
+        return {
+            **super().stats(),
+            "pool": {
+                "primary": self._pool.stats(),
+                "replicas": [pool.stats() for pool in self._replicas.replicas],
+            }
+        }
+
+    def _drop(self, ns: str, obj_id: int) -> None:
+        # Another instance wrote this object; keep reading it from the primary
+        # for a while so the reload does not cache a lagging replica's copy.
+        self._replicas.touch(("user" if ns in ("user", "user_files") else "file", obj_id))
+        super()._drop(ns, obj_id)
+
     async def init_db(self) -> None:
         statements = read_sql_file("tgfs/database/mysql/schema.sql")
 
@@ -73,3 +103,31 @@ class MySQLDB(FileDB, GroupDB, UserDB, UtilDB):
                     await cur.execute(stmt)
                 await conn.commit()
             warnings.filterwarnings('default', module=r"aiomysql")
+
+    def migrations(self) -> list[Migration]:
+        migrations = [Migration("0.0.1", "indexes", self.migrate_indexes)]
+        if self.partitions:
+            migrations.append(Migration("0.0.1", "partitions", self.migrate_partitions))
+        return migrations
+
+    async def migrate_indexes(self, state: dict, batch_size: int) -> AsyncGenerator[dict, None]: # pylint: disable=W0613
+        """
+        Build the missing INDEXES one at a time without blocking writes.
+        Only the instance holding the migration lock runs it.
+        """
+        async with migration_lock(self._lock_params):
+            for table, name, columns in INDEXES:
+                async with self._pool.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            """
+                            SELECT 1 FROM information_schema.STATISTICS
+                            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+                            LIMIT 1
+                            """,
+                            (table, name)
+                        )
+                        if await cur.fetchone():
+                            continue
+                        await cur.execute(f"ALTER TABLE {table} ADD INDEX {name} {columns}, ALGORITHM=INPLACE, LOCK=NONE")
+                yield {"index": name}
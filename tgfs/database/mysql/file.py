@@ -20,11 +20,15 @@ import aiomysql
 from telethon.tl.types import InputDocumentFileLocation, InputPhotoFileLocation
 
 from tgfs.database.database import BaseStorage
-from tgfs.utils.types import FileSource, FileInfo, InputTypeLocation
+from tgfs.utils.types import FileSource, FileInfo, InputTypeLocation, PageCursor
+
+from .replica import ReplicaSet
+from .utils import batched, bump_counters, keyset_clause, read_counters
 
 
 class FileDB(BaseStorage):
     _pool: aiomysql.Pool
+    _replicas: ReplicaSet
 
     async def add_file(self, user_id: int, file: FileInfo, source: FileSource) -> None:
         async with self._pool.acquire() as conn:
@@ -58,7 +62,10 @@ class FileDB(BaseStorage):
                         """,
                         (user_id, file.id, source.chat_id, source.message_id)
                     )
+                    if cur.rowcount == 1:
+                        await bump_counters(cur, user_id, files=1)
                     await conn.commit()
+                    self._replicas.touch(("user", user_id), ("file", file.id))
                 except Exception:
                     await conn.rollback()
                     raise
@@ -74,12 +81,13 @@ class FileDB(BaseStorage):
                         (status, file_id)
                     )
                     await conn.commit()
+                    self._replicas.touch(("file", file_id))
                 except Exception:
                     await conn.rollback()
                     raise
 
     async def get_file(self, file_id: int, user_id: Optional[int] = None) -> Optional[FileInfo]:
-        async with self._pool.acquire() as conn:
+        async with self._replicas.read(("file", file_id), ("user", user_id)).acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 if user_id is None:
                     await cur.execute(
@@ -135,7 +143,7 @@ class FileDB(BaseStorage):
                 )
 
     async def get_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
-        async with self._pool.acquire() as conn:
+        async with self._replicas.read(("file", file.id)).acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 await cur.execute(
                     """
@@ -158,8 +166,56 @@ class FileDB(BaseStorage):
                     thumb_size=file.thumb_size
                 )
 
+    async def resolve_stream(self, file_id: int, user_id: int, bot_id: int
+                             ) -> tuple[Optional[FileInfo], Optional[InputTypeLocation]]:
+        async with self._replicas.read(("file", file_id), ("user", user_id)).acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(
+                    """
+                    SELECT f.id AS file_id,
+                           f.dc_id,
+                           f.size AS file_size,
+                           f.mime_type,
+                           f.file_name,
+                           f.thumb_size,
+                           f.is_deleted,
+                           fl.access_hash,
+                           fl.file_reference
+                    FROM USER_FILE uf
+                    JOIN TGFILE f ON f.id = uf.id
+                    LEFT JOIN FILE_LOCATION fl
+                      ON fl.id = uf.id AND fl.bot_id = %s
+                    WHERE uf.user_id = %s AND uf.id = %s
+                    LIMIT 1
+                    """,
+                    (bot_id, user_id, file_id)
+                )
+                row = await cur.fetchone()
+                if not row:
+                    return None, None
+
+                file = FileInfo(
+                    id=int(row["file_id"]),
+                    dc_id=int(row["dc_id"]),
+                    file_size=int(row["file_size"]),
+                    mime_type=row["mime_type"],
+                    file_name=row["file_name"],
+                    thumb_size=row["thumb_size"],
+                    is_deleted=bool(row["is_deleted"]),
+                )
+                if row["access_hash"] is None:
+                    return file, None
+
+                cls = InputPhotoFileLocation if file.thumb_size else InputDocumentFileLocation
+                return file, cls(
+                    id=file.id,
+                    access_hash=int(row["access_hash"]),
+                    file_reference=row["file_reference"],
+                    thumb_size=file.thumb_size
+                )
+
     async def get_source(self, file_id: int, user_id: int) -> Optional[FileSource]:
-        async with self._pool.acquire() as conn:
+        async with self._replicas.read(("file", file_id), ("user", user_id)).acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 await cur.execute(
                     """
@@ -194,34 +250,62 @@ class FileDB(BaseStorage):
                         (bot_id, loc.id, loc.access_hash, loc.file_reference)
                     )
                     await conn.commit()
+                    self._replicas.touch(("file", loc.id))
                 except Exception:
                     await conn.rollback()
                     raise
 
-    async def get_files(self, user_id: int, offset: int = 0, limit: Optional[int] = None
-                        ) -> AsyncGenerator[tuple[int, str], None]:
+    async def upsert_locations(self, items: list[tuple[int, InputTypeLocation]]) -> None:
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    await cur.executemany(
+                        """
+                        INSERT INTO FILE_LOCATION (bot_id, id, access_hash, file_reference)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                          access_hash = VALUES(access_hash),
+                          file_reference = VALUES(file_reference)
+                        """,
+                        [(bot_id, loc.id, loc.access_hash, loc.file_reference) for bot_id, loc in items]
+                    )
+                    await conn.commit()
+                    self._replicas.touch(*(("file", loc.id) for _, loc in items))
+                except Exception:
+                    await conn.rollback()
+                    raise
 
-        base_sql = """
-            SELECT f.id AS file_id, f.file_name
-            FROM TGFILE f
-            JOIN USER_FILE uf ON f.id = uf.id
-            WHERE uf.user_id = %s
-            ORDER BY uf.added_at DESC
+    async def _list_files(self, user_id: int, offset: int, limit: Optional[int],
+                          after: Optional[PageCursor], before: Optional[PageCursor]) -> list[tuple]:
+        clause, params, order = keyset_clause("uf.added_at", "uf.id", after, before)
+        base_sql = f"""
+            SELECT f.id AS file_id, f.file_name, UNIX_TIMESTAMP(uf.added_at)
+            FROM USER_FILE uf
+            JOIN TGFILE f ON f.id = uf.id
+            WHERE uf.user_id = %s{clause}
+            ORDER BY uf.added_at {order}, uf.id {order}
         """
 
-        params = [user_id]
+        params = [user_id, *params]
 
         if limit is not None:
-            base_sql += " LIMIT %s OFFSET %s"
-            params.extend([limit, offset])
+            base_sql += " LIMIT %s"
+            params.append(limit)
+            if not clause:
+                base_sql += " OFFSET %s"
+                params.append(offset)
 
-        async with self._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.SSCursor) as cur:
+        async with self._replicas.read(("user", user_id)).acquire() as conn:
+            async with conn.cursor() as cur:
                 await cur.execute(base_sql, params)
+                rows = await cur.fetchall()
+        return rows[::-1] if before else rows
 
-                async for row in cur:
-                    file_id, file_name = row
-                    yield int(file_id), str(file_name)
+    async def get_files(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                        after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+                        ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        async for file_id, file_name, added_at in batched(self._list_files, user_id, offset, limit, after, before):
+            yield int(file_id), str(file_name), PageCursor(int(added_at), int(file_id))
 
     async def get_files2(self, user_id: int, file_ids: list[int], full: bool = False,
                          ) -> AsyncGenerator[FileInfo | tuple[int, str], None]:
@@ -247,31 +331,32 @@ class FileDB(BaseStorage):
 
         params = [user_id] + file_ids
 
-        async with self._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.SSCursor) as cur:
+        # The rows are bounded by file_ids, read them all so the connection is
+        # back in the pool before the caller resumes
+        async with self._replicas.read(("user", user_id)).acquire() as conn:
+            async with conn.cursor() as cur:
                 await cur.execute(base_sql, params)
+                columns = [col[0] for col in cur.description]
+                rows = await cur.fetchall()
 
-                if full:
-                    columns = [col[0] for col in cur.description]
-
-                    async for raw_row in cur:
-                        row = dict(zip(columns, raw_row))
-                        yield FileInfo(
-                            id=int(row["id"]),
-                            dc_id=int(row["dc_id"]),
-                            file_size=int(row["size"]),
-                            mime_type=row["mime_type"],
-                            file_name=row["file_name"],
-                            thumb_size=row["thumb_size"],
-                            is_deleted=bool(row["is_deleted"]),
-                        )
-                else:
-                    async for row in cur:
-                        file_id, file_name = row
-                        yield int(file_id), str(file_name)
+        if full:
+            for raw_row in rows:
+                row = dict(zip(columns, raw_row))
+                yield FileInfo(
+                    id=int(row["id"]),
+                    dc_id=int(row["dc_id"]),
+                    file_size=int(row["size"]),
+                    mime_type=row["mime_type"],
+                    file_name=row["file_name"],
+                    thumb_size=row["thumb_size"],
+                    is_deleted=bool(row["is_deleted"]),
+                )
+        else:
+            for file_id, file_name in rows:
+                yield int(file_id), str(file_name)
 
     async def get_file_users(self, file_id: int, ) -> set[int]:
-        async with self._pool.acquire() as conn:
+        async with self._replicas.read(("file", file_id)).acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(
                     """
@@ -288,22 +373,23 @@ class FileDB(BaseStorage):
     async def total_files(self, user_id: int) -> int:
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM USER_FILE
-                    WHERE user_id = %s
-                    """,
-                    (user_id,)
-                )
-
-                row = await cur.fetchone()
-                return int(row[0]) if row else 0
+                try:
+                    files, _ = await read_counters(cur, user_id)
+                    await conn.commit()
+                    return files
+                except Exception:
+                    await conn.rollback()
+                    raise
 
     async def delete_file(self, file_id: int) -> bool:
         async with self._pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 try:
+                    # Foreign keys are done here, the partitioned layout has none
+                    await cur.execute("SELECT 1 FROM USER_FILE WHERE id = %s LIMIT 1 FOR UPDATE", (file_id,))
+                    if await cur.fetchone():
+                        raise aiomysql.IntegrityError(1451, f"File {file_id} is still referenced by USER_FILE")
+                    await cur.execute("DELETE FROM FILE_LOCATION WHERE id = %s", (file_id,))
                     await cur.execute(
                         """
                         DELETE FROM TGFILE
@@ -314,6 +400,7 @@ class FileDB(BaseStorage):
                     )
                     deleted = bool(cur.rowcount > 0)
                     await conn.commit()
+                    self._replicas.touch(("file", file_id))
                     return deleted
                 except Exception:
                     await conn.rollback()
@@ -323,6 +410,10 @@ class FileDB(BaseStorage):
         async with self._pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 try:
+                    await cur.execute(
+                        "DELETE FROM FILE_GROUP_FILE WHERE user_id = %s AND id = %s",
+                        (user_id, file_id)
+                    )
                     await cur.execute(
                         """
                         DELETE FROM USER_FILE
@@ -332,7 +423,10 @@ class FileDB(BaseStorage):
                         (file_id, user_id)
                     )
                     deleted = bool(cur.rowcount > 0)
+                    if deleted:
+                        await bump_counters(cur, user_id, files=-1)
                     await conn.commit()
+                    self._replicas.touch(("user", user_id), ("file", file_id))
                     return deleted
                 except Exception:
                     await conn.rollback()
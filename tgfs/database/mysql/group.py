@@ -14,17 +14,37 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import asyncio
 from typing import AsyncGenerator, Optional
 
 import aiomysql
 
 from tgfs.database.database import BaseStorage
-from tgfs.utils.types import GroupInfo
+from tgfs.utils.types import FileInfo, FileSource, GroupFile, GroupInfo, InputTypeLocation, PageCursor
+
+from .replica import ReplicaSet
+from .utils import batched, bump_counters, keyset_clause, read_counters
 
 class GroupDB(BaseStorage):
-    _list_lock = asyncio.Lock()
     _pool: aiomysql.Pool
+    _replicas: ReplicaSet
+
+    @staticmethod
+    async def _last_order(cur: aiomysql.Cursor, group_id: int) -> int:
+        # Locking the FILE_GROUP row serializes writers of this group only
+        await cur.execute(
+            "SELECT group_id FROM FILE_GROUP WHERE group_id = %s FOR UPDATE",
+            (group_id,)
+        )
+        await cur.execute(
+            """
+            SELECT COALESCE(MAX(order_index), 0)
+            FROM FILE_GROUP_FILE
+            WHERE group_id = %s
+            """,
+            (group_id,)
+        )
+        row = await cur.fetchone()
+        return int(row[0]) if row else 0
 
     async def create_group(self, user_id: int, name: str) -> int:
         async with self._pool.acquire() as conn:
@@ -38,68 +58,150 @@ class GroupDB(BaseStorage):
                         (user_id, name)
                     )
                     group_id = cur.lastrowid
+                    await bump_counters(cur, user_id, groups=1)
                     await conn.commit()
+                    self._replicas.touch(("user", user_id))
                     return group_id
                 except Exception:
                     await conn.rollback()
                     raise
 
     async def add_file_to_group(self, group_id: int, user_id: int, file_id: int, order: Optional[int] = None) -> None:
-        async with self._list_lock:
-            async with self._pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    try:
-                        if order is None:
-                            await cur.execute(
-                                """
-                                SELECT COALESCE(MAX(order_index), 0) + 1
-                                FROM FILE_GROUP_FILE
-                                WHERE group_id = %s
-                                FOR UPDATE
-                                """,
-                                (group_id,)
-                            )
-                            row = await cur.fetchone()
-                            order = int(row[0]) if row else 1
-
-                        await cur.execute(
-                            """
-                            INSERT INTO FILE_GROUP_FILE (group_id, user_id, id, order_index)
-                            VALUES (%s, %s, %s, %s)
-                            ON DUPLICATE KEY UPDATE
-                              order_index = VALUES(order_index)
-                            """,
-                            (group_id, user_id, file_id, order)
-                        )
-
-                        await conn.commit()
-                    except Exception:
-                        await conn.rollback()
-                        raise
-
-    async def get_groups(self, user_id: int, offset: int = 0, limit: Optional[int] = None
-        ) -> AsyncGenerator[tuple[int, str], None]:
-        base_sql = """
-                    SELECT group_id, name
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    if order is None:
+                        order = await self._last_order(cur, group_id) + 1
+
+                    await cur.execute(
+                        """
+                        INSERT INTO FILE_GROUP_FILE (group_id, user_id, id, order_index)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                          order_index = VALUES(order_index)
+                        """,
+                        (group_id, user_id, file_id, order)
+                    )
+
+                    await conn.commit()
+                    self._replicas.touch(("user", user_id))
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+    async def add_files_to_group(self, group_id: int, user_id: int, bot_id: int,
+                                 files: list[tuple[FileInfo, FileSource, InputTypeLocation]]) -> None:
+        if not files:
+            return
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    start = await self._last_order(cur, group_id)
+                    file_ids = list({file.id for file, _, _ in files})
+                    await cur.execute(
+                        f"""
+                        SELECT COUNT(*) FROM USER_FILE
+                        WHERE user_id = %s AND id IN ({", ".join(["%s"] * len(file_ids))})
+                        FOR UPDATE
+                        """,
+                        (user_id, *file_ids)
+                    )
+                    existing = (await cur.fetchone())[0]
+                    await cur.executemany(
+                        """
+                        INSERT INTO TGFILE (id, dc_id, size, mime_type, file_name, thumb_size, is_deleted)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                          dc_id = VALUES(dc_id),
+                          size = VALUES(size),
+                          mime_type = VALUES(mime_type),
+                          file_name = VALUES(file_name),
+                          thumb_size = VALUES(thumb_size),
+                          is_deleted = VALUES(is_deleted)
+                        """,
+                        [
+                            (file.id, file.dc_id, file.file_size, file.mime_type,
+                             file.file_name, file.thumb_size, file.is_deleted)
+                            for file, _, _ in files
+                        ]
+                    )
+                    await cur.executemany(
+                        """
+                        INSERT INTO USER_FILE (user_id, id, source_chat_id, source_msg_id)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                          source_chat_id = COALESCE(VALUES(source_chat_id), source_chat_id),
+                          source_msg_id = COALESCE(VALUES(source_msg_id), source_msg_id)
+                        """,
+                        [
+                            (user_id, file.id, source.chat_id, source.message_id)
+                            for file, source, _ in files
+                        ]
+                    )
+                    await bump_counters(cur, user_id, files=len(file_ids) - int(existing))
+                    await cur.executemany(
+                        """
+                        INSERT INTO FILE_LOCATION (bot_id, id, access_hash, file_reference)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                          access_hash = VALUES(access_hash),
+                          file_reference = VALUES(file_reference)
+                        """,
+                        [
+                            (bot_id, loc.id, loc.access_hash, loc.file_reference)
+                            for _, _, loc in files
+                        ]
+                    )
+                    await cur.executemany(
+                        """
+                        INSERT INTO FILE_GROUP_FILE (group_id, user_id, id, order_index)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                          order_index = VALUES(order_index)
+                        """,
+                        [
+                            (group_id, user_id, file.id, start + i)
+                            for i, (file, _, _) in enumerate(files, 1)
+                        ]
+                    )
+                    await conn.commit()
+                    self._replicas.touch(("user", user_id), *(("file", file.id) for file, _, _ in files))
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+    async def _list_groups(self, user_id: int, offset: int, limit: Optional[int],
+                           after: Optional[PageCursor], before: Optional[PageCursor]) -> list[tuple]:
+        clause, params, order = keyset_clause("created_at", "group_id", after, before)
+        base_sql = f"""
+                    SELECT group_id, name, UNIX_TIMESTAMP(created_at)
                     FROM FILE_GROUP
-                    WHERE user_id = %s
-                    ORDER BY created_at DESC
+                    WHERE user_id = %s{clause}
+                    ORDER BY created_at {order}, group_id {order}
                     """
-        params = [user_id]
+        params = [user_id, *params]
 
         if limit is not None:
-            base_sql += " LIMIT %s OFFSET %s"
-            params.extend([limit, offset])
+            base_sql += " LIMIT %s"
+            params.append(limit)
+            if not clause:
+                base_sql += " OFFSET %s"
+                params.append(offset)
 
-        async with self._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.SSCursor) as cur:
+        async with self._replicas.read(("user", user_id)).acquire() as conn:
+            async with conn.cursor() as cur:
                 await cur.execute(base_sql, params)
-                async for row in cur:
-                    group_id, name = row
-                    yield int(group_id), str(name)
+                rows = await cur.fetchall()
+        return rows[::-1] if before else rows
+
+    async def get_groups(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                         after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+        ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        async for group_id, name, created_at in batched(self._list_groups, user_id, offset, limit, after, before):
+            yield int(group_id), str(name), PageCursor(int(created_at), int(group_id))
 
     async def get_group(self, group_id: int, user_id: int) -> Optional[GroupInfo]:
-        async with self._pool.acquire() as conn:
+        async with self._replicas.read(("user", user_id)).acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 await cur.execute(
                     """
@@ -138,10 +240,106 @@ class GroupDB(BaseStorage):
                 gi.files.extend([int(r["id"]) for r in rows])
                 return gi
 
+    async def get_group_with_files(self, group_id: int, user_id: int
+                                   ) -> Optional[tuple[GroupInfo, list[GroupFile]]]:
+        async with self._replicas.read(("user", user_id)).acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(
+                    """
+                    SELECT g.group_id, g.user_id, g.name, g.created_at,
+                      f.id, f.file_name, f.size, f.mime_type, f.is_deleted, gf.order_index
+                    FROM FILE_GROUP g
+                    LEFT JOIN FILE_GROUP_FILE gf ON gf.group_id = g.group_id
+                    LEFT JOIN TGFILE f ON f.id = gf.id
+                    WHERE g.group_id = %s AND g.user_id = %s
+                    ORDER BY gf.order_index ASC, gf.id ASC
+                    """,
+                    (group_id, user_id)
+                )
+                rows = await cur.fetchall()
+        if not rows:
+            return None
+
+        row = rows[0]
+        files = [
+            GroupFile(
+                id=int(r["id"]),
+                file_name=r["file_name"],
+                file_size=int(r["size"]),
+                mime_type=r["mime_type"],
+                order=int(r["order_index"]),
+                is_deleted=bool(r["is_deleted"]),
+            )
+            for r in rows if r["id"] is not None
+        ]
+        return GroupInfo(
+            group_id=int(row["group_id"]),
+            user_id=int(row["user_id"]),
+            name=row["name"],
+            created_at=row.get("created_at"),
+            files=[f.id for f in files]
+        ), files
+
+    async def iter_group_files(self, group_id: int, user_id: int, batch_size: int = 500
+                               ) -> AsyncGenerator[GroupFile, None]:
+        last_order, last_id = -1, 0
+        while True:
+            # The connection goes back to the pool between batches
+            async with self._replicas.read(("user", user_id)).acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        SELECT gf.id, f.file_name, f.size, f.mime_type, gf.order_index, f.is_deleted
+                        FROM FILE_GROUP_FILE gf
+                        JOIN FILE_GROUP g ON g.group_id = gf.group_id
+                        JOIN TGFILE f ON f.id = gf.id
+                        WHERE gf.group_id = %s AND g.user_id = %s
+                          AND (gf.order_index > %s OR (gf.order_index = %s AND gf.id > %s))
+                        ORDER BY gf.order_index ASC, gf.id ASC
+                        LIMIT %s
+                        """,
+                        (group_id, user_id, last_order, last_order, last_id, batch_size)
+                    )
+                    rows = await cur.fetchall()
+
+            for file_id, file_name, size, mime_type, order, is_deleted in rows:
+                yield GroupFile(int(file_id), file_name, int(size), mime_type, int(order), bool(is_deleted))
+            if len(rows) < batch_size:
+                return
+            last_order, last_id = int(rows[-1][4]), int(rows[-1][0])
+
+    async def get_next_group_file(self, file_id: int, user_id: int) -> Optional[int]:
+        async with self._replicas.read(("user", user_id)).acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    SELECT nxt.id
+                    FROM FILE_GROUP_FILE cur
+                    JOIN FILE_GROUP_FILE nxt
+                      ON nxt.group_id = cur.group_id
+                      AND (nxt.order_index > cur.order_index
+                        OR (nxt.order_index = cur.order_index AND nxt.id > cur.id))
+                    WHERE cur.user_id = %s AND cur.id = %s
+                    ORDER BY cur.group_id DESC, nxt.order_index ASC, nxt.id ASC
+                    LIMIT 1
+                    """,
+                    (user_id, file_id)
+                )
+                row = await cur.fetchone()
+                return int(row[0]) if row else None
+
     async def delete_group(self, group_id: int, user_id: int) -> None:
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
                 try:
+                    await cur.execute(
+                        """
+                        DELETE gf FROM FILE_GROUP_FILE gf
+                        JOIN FILE_GROUP g ON g.group_id = gf.group_id
+                        WHERE g.group_id = %s AND g.user_id = %s
+                        """,
+                        (group_id, user_id)
+                    )
                     await cur.execute(
                         """
                         DELETE FROM FILE_GROUP
@@ -149,7 +347,10 @@ class GroupDB(BaseStorage):
                         """,
                         (group_id, user_id)
                     )
+                    if cur.rowcount:
+                        await bump_counters(cur, user_id, groups=-cur.rowcount)
                     await conn.commit()
+                    self._replicas.touch(("user", user_id))
                 except Exception:
                     await conn.rollback()
                     raise
@@ -167,6 +368,7 @@ class GroupDB(BaseStorage):
                         (name, group_id, user_id)
                     )
                     await conn.commit()
+                    self._replicas.touch(("user", user_id))
                 except Exception:
                     await conn.rollback()
                     raise
@@ -188,20 +390,18 @@ class GroupDB(BaseStorage):
                         (new_order, group_id, file_id, user_id)
                     )
                     await conn.commit()
+                    self._replicas.touch(("user", user_id))
                 except Exception:
                     await conn.rollback()
                     raise
+
     async def total_groups(self, user_id: int) -> int:
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
-                await cur.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM FILE_GROUP
-                    WHERE user_id = %s
-                    """,
-                    (user_id)
-                )
-
-                row = await cur.fetchone()
-                return int(row[0]) if row else 0
+                try:
+                    _, groups = await read_counters(cur, user_id)
+                    await conn.commit()
+                    return groups
+                except Exception:
+                    await conn.rollback()
+                    raise
@@ -0,0 +1,170 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+from typing import AsyncGenerator
+
+import aiomysql
+
+from tgfs.database.database import BaseStorage
+
+from .utils import migration_lock, read_sql_file
+
+log = logging.getLogger(__name__)
+
+# Table -> (primary key, columns copied)
+PARTITIONED_TABLES = {
+    "FILE_LOCATION": (("bot_id", "id"), ("bot_id", "id", "access_hash", "file_reference")),
+    "USER_FILE": (("user_id", "id"), ("user_id", "id", "source_chat_id", "source_msg_id", "added_at")),
+    "FILE_GROUP_FILE": (("group_id", "user_id", "id"), ("group_id", "user_id", "id", "order_index")),
+}
+
+
+def mirror_triggers(table: str) -> dict[str, str]:
+    """Triggers that repeat every write on ``table`` into ``<table>_NEW``."""
+    pk, cols = PARTITIONED_TABLES[table]
+    new = f"{table}_NEW"
+    match = " AND ".join(f"{c} = OLD.{c}" for c in pk)
+    replace = f"REPLACE INTO {new} ({', '.join(cols)}) VALUES ({', '.join(f'NEW.{c}' for c in cols)})"
+    return {
+        f"{table}_mirror_ins": f"AFTER INSERT ON {table} FOR EACH ROW {replace}",
+        f"{table}_mirror_upd": f"AFTER UPDATE ON {table} FOR EACH ROW BEGIN DELETE FROM {new} WHERE {match}; {replace}; END",
+        f"{table}_mirror_del": f"AFTER DELETE ON {table} FOR EACH ROW DELETE FROM {new} WHERE {match}",
+    }
+
+
+class PartitionDB(BaseStorage):
+    _pool: aiomysql.Pool
+    _lock_params: dict
+    partitions: int = 0
+
+    @staticmethod
+    async def is_partitioned(cur: aiomysql.Cursor) -> bool:
+        await cur.execute(
+            f"""
+            SELECT COUNT(DISTINCT TABLE_NAME) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND PARTITION_NAME IS NOT NULL
+              AND TABLE_NAME IN ({", ".join(["%s"] * len(PARTITIONED_TABLES))})
+            """,
+            tuple(PARTITIONED_TABLES)
+        )
+        return (await cur.fetchone())[0] == len(PARTITIONED_TABLES)
+
+    async def migrate_partitions(self, state: dict, batch_size: int) -> AsyncGenerator[dict, None]:
+        """
+        Move ``FILE_LOCATION``, ``USER_FILE`` and ``FILE_GROUP_FILE`` to the
+        layout of ``schema_partitioned.sql`` while the bot keeps serving.
+
+        The partitioned copies are created as ``<table>_NEW`` and triggers
+        repeat every write on the live tables into them. Existing rows are
+        then copied in primary key order, yielding the last copied key after
+        every batch. Finally all three tables are swapped in one
+        ``RENAME TABLE`` and the old ones are dropped. Only the instance
+        holding the migration lock runs it; the others skip it.
+        """
+        async with migration_lock(self._lock_params):
+            async with self._pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    if await self.is_partitioned(cur):
+                        # A previous run may have stopped right after the swap
+                        await self._drop_old_partitions(cur)
+                        return
+                    await self._prepare_partitions(cur, self.partitions)
+                    await conn.commit()
+            async for progress in self._copy_partitions(self._pool, state, batch_size):
+                yield progress
+            async with self._pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await self._swap_partitions(cur)
+
+    async def _prepare_partitions(self, cur: aiomysql.Cursor, partitions: int) -> None:
+        for stmt in read_sql_file("tgfs/database/mysql/schema_partitioned.sql"):
+            await cur.execute(stmt.format(partitions=max(1, partitions)))
+
+        for table in PARTITIONED_TABLES:
+            for name, body in mirror_triggers(table).items():
+                await cur.execute(
+                    """
+                    SELECT 1 FROM information_schema.TRIGGERS
+                    WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = %s
+                    """,
+                    (name,)
+                )
+                if not await cur.fetchone():
+                    await cur.execute(f"CREATE TRIGGER {name} {body}")
+
+    @staticmethod
+    async def _copy_partitions(pool: aiomysql.Pool, state: dict, batch_size: int) -> AsyncGenerator[dict, None]:
+        tables = list(PARTITIONED_TABLES)
+        start = tables.index(state["table"]) if state.get("table") in tables else 0
+
+        for table in tables[start:]:
+            pk, cols = PARTITIONED_TABLES[table]
+            pk_sql = ", ".join(pk)
+            row_sql = f"({pk_sql})"
+            key_sql = f"({', '.join(['%s'] * len(pk))})"
+            last = state.get("last") if state.get("table") == table else None
+            log.info("Copying %s into its partitioned layout", table)
+
+            while True:
+                lower = f"{row_sql} > {key_sql}" if last else "TRUE"
+                async with pool.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            f"SELECT {pk_sql} FROM {table} WHERE {lower} ORDER BY {pk_sql} LIMIT 1 OFFSET %s",
+                            (*(last or ()), batch_size - 1)
+                        )
+                        upper = await cur.fetchone()
+                        try:
+                            await cur.execute(
+                                f"""
+                                INSERT IGNORE INTO {table}_NEW ({", ".join(cols)})
+                                SELECT {", ".join(cols)} FROM {table}
+                                WHERE {lower}{f" AND {row_sql} <= {key_sql}" if upper else ""}
+                                """,
+                                (*(last or ()), *(upper or ()))
+                            )
+                            await conn.commit()
+                        except Exception:
+                            await conn.rollback()
+                            raise
+                if upper is None:
+                    break
+                last = [int(v) for v in upper]
+                yield {"table": table, "last": last}
+
+            next_table = tables.index(table) + 1
+            if next_table < len(tables):
+                yield {"table": tables[next_table], "last": None}
+
+    @staticmethod
+    async def _swap_partitions(cur: aiomysql.Cursor) -> None:
+        await cur.execute(
+            "RENAME TABLE " + ", ".join(
+                f"{table} TO {table}_OLD, {table}_NEW TO {table}" for table in PARTITIONED_TABLES
+            )
+        )
+        await PartitionDB._drop_old_partitions(cur)
+
+    @staticmethod
+    async def _drop_old_partitions(cur: aiomysql.Cursor) -> None:
+        for table in PARTITIONED_TABLES:
+            for name in mirror_triggers(table):
+                await cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        # Children first, FILE_GROUP_FILE_OLD references USER_FILE_OLD
+        for table in reversed(PARTITIONED_TABLES):
+            await cur.execute(f"DROP TABLE IF EXISTS {table}_OLD")
@@ -0,0 +1,69 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import aiomysql
+
+
+class MeteredPool:
+    """
+    Wraps an ``aiomysql.Pool`` and records how long callers wait in
+    ``acquire()`` and how many connections are in use.
+    """
+
+    def __init__(self, pool: aiomysql.Pool) -> None:
+        self._pool = pool
+        self.waiting = 0
+        self.acquires = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiomysql.Connection]:
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            conn = await self._pool.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - start
+        self.acquires += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    def stats(self) -> dict[str, Any]:
+        size, free, maxsize = self._pool.size, self._pool.freesize, self._pool.maxsize
+        return {
+            "size": size,
+            "free": free,
+            "max": maxsize,
+            "waiting": self.waiting,
+            "utilization": round((size - free) / maxsize, 3) if maxsize else 0.0,
+            "acquires": self.acquires,
+            "wait_avg_ms": round(self.wait_total / self.acquires * 1000, 3) if self.acquires else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
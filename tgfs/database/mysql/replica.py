@@ -0,0 +1,70 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+import aiomysql
+
+
+class ReplicaSet:
+    """
+    Picks the pool a read runs on.
+
+    Reads go round-robin to the replicas unless one of the keys they touch
+    (``("user", id)``, ``("file", id)``) was written through this instance
+    within the last ``window`` seconds, in which case they go to the primary
+    so a user always sees their own writes.
+    """
+
+    def __init__(self, primary: aiomysql.Pool, replicas: list[aiomysql.Pool], window: float) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.window = window
+        self._next = itertools.cycle(replicas)
+        self._recent: OrderedDict[Hashable, float] = OrderedDict()
+
+    def touch(self, *keys: Hashable) -> None:
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        for key in keys:
+            self._recent[key] = now + self.window
+            self._recent.move_to_end(key)
+        # Entries are kept in deadline order, expired ones are at the front
+        while self._recent:
+            key, deadline = next(iter(self._recent.items()))
+            if deadline > now:
+                break
+            del self._recent[key]
+
+    def read(self, *keys: Hashable) -> aiomysql.Pool:
+        if not self.replicas:
+            return self.primary
+        now = time.monotonic()
+        for key in keys:
+            deadline = self._recent.get(key)
+            if deadline is not None and deadline > now:
+                return self.primary
+        return next(self._next)
+
+    async def close(self) -> None:
+        for pool in self.replicas:
+            pool.close()
+        for pool in self.replicas:
+            await pool.wait_closed()
@@ -34,6 +34,7 @@ CREATE TABLE IF NOT EXISTS USER_FILE (
   source_msg_id BIGINT UNSIGNED NULL,
   added_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (user_id, id),
+  KEY idx_user_file_added (user_id, added_at),
   CONSTRAINT fk_user_files_users FOREIGN KEY (user_id) REFERENCES TGUSER(user_id) ON DELETE CASCADE,
   CONSTRAINT fk_user_files_files FOREIGN KEY (id) REFERENCES TGFILE(id) ON DELETE RESTRICT
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -43,6 +44,7 @@ CREATE TABLE IF NOT EXISTS FILE_GROUP (
   user_id BIGINT UNSIGNED NOT NULL,
   name VARCHAR(255) NOT NULL,
   created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  KEY idx_file_group_created (user_id, created_at),
   CONSTRAINT fk_file_group_owner FOREIGN KEY (user_id) REFERENCES TGUSER(user_id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -52,10 +54,18 @@ CREATE TABLE IF NOT EXISTS FILE_GROUP_FILE (
   id BIGINT UNSIGNED NOT NULL,
   order_index INT UNSIGNED NOT NULL DEFAULT 0,
   PRIMARY KEY (group_id, user_id, id),
+  KEY idx_group_file_order (group_id, order_index, id),
   CONSTRAINT fk_fg_group FOREIGN KEY (group_id) REFERENCES FILE_GROUP(group_id) ON DELETE CASCADE,
   CONSTRAINT fk_fg_user_file FOREIGN KEY (user_id, id) REFERENCES USER_FILE(user_id, id) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
+CREATE TABLE IF NOT EXISTS USER_STATS (
+  user_id BIGINT UNSIGNED PRIMARY KEY,
+  file_count BIGINT NOT NULL DEFAULT 0,
+  group_count BIGINT NOT NULL DEFAULT 0,
+  CONSTRAINT fk_user_stats_users FOREIGN KEY (user_id) REFERENCES TGUSER(user_id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
 CREATE TABLE IF NOT EXISTS APP_CONFIG (
   k VARCHAR(64) PRIMARY KEY,
   v BLOB NOT NULL,
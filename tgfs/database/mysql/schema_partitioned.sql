@@ -0,0 +1,37 @@
+-- Partitioned layout of the three largest tables, enabled with MYSQL_PARTITIONS.
+-- InnoDB does not allow foreign keys on partitioned tables, so the cascades of
+-- schema.sql are done by the queries instead. These are created next to the
+-- live tables and swapped in by tgfs/database/mysql/partition.py.
+
+CREATE TABLE IF NOT EXISTS FILE_LOCATION_NEW (
+  bot_id BIGINT UNSIGNED NOT NULL,
+  id BIGINT UNSIGNED NOT NULL,
+  access_hash BIGINT NULL,
+  file_reference BLOB NULL,
+  PRIMARY KEY (bot_id, id),
+  KEY idx_file_location_id (id)
+) ENGINE=InnoDB ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8
+  PARTITION BY KEY (id) PARTITIONS {partitions};
+
+CREATE TABLE IF NOT EXISTS USER_FILE_NEW (
+  user_id BIGINT UNSIGNED NOT NULL,
+  id BIGINT UNSIGNED NOT NULL,
+  source_chat_id BIGINT NULL,
+  source_msg_id BIGINT UNSIGNED NULL,
+  added_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (user_id, id),
+  KEY idx_user_file_added (user_id, added_at),
+  KEY idx_user_file_id (id)
+) ENGINE=InnoDB ROW_FORMAT=DYNAMIC
+  PARTITION BY KEY (user_id) PARTITIONS {partitions};
+
+CREATE TABLE IF NOT EXISTS FILE_GROUP_FILE_NEW (
+  group_id BIGINT UNSIGNED NOT NULL,
+  user_id BIGINT UNSIGNED NOT NULL,
+  id BIGINT UNSIGNED NOT NULL,
+  order_index INT UNSIGNED NOT NULL DEFAULT 0,
+  PRIMARY KEY (group_id, user_id, id),
+  KEY idx_group_file_order (group_id, order_index, id),
+  KEY idx_group_file_user_file (user_id, id)
+) ENGINE=InnoDB ROW_FORMAT=DYNAMIC
+  PARTITION BY KEY (group_id) PARTITIONS {partitions};
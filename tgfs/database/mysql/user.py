@@ -21,12 +21,16 @@ import aiomysql
 from tgfs.database.database import BaseStorage
 from tgfs.utils.types import User
 
+from .replica import ReplicaSet
+from .utils import LIST_BATCH_SIZE
+
 
 class UserDB(BaseStorage):
     _pool: aiomysql.Pool
+    _replicas: ReplicaSet
 
     async def get_user(self, user_id: int) -> Optional[User]:
-        async with self._pool.acquire() as conn:
+        async with self._replicas.read(("user", user_id)).acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 await cur.execute(
                     """
@@ -50,6 +54,7 @@ class UserDB(BaseStorage):
                     )
                     inserted = cur.rowcount > 0
                     await conn.commit()
+                    self._replicas.touch(("user", user_id))
                     return bool(inserted)
                 except Exception:
                     await conn.rollback()
@@ -75,6 +80,7 @@ class UserDB(BaseStorage):
                          user.preferred_lang, user.curt_op.value, user.op_id)
                     )
                     await conn.commit()
+                    self._replicas.touch(("user", user.user_id))
                     return True
                 except Exception:
                     await conn.rollback()
@@ -84,30 +90,56 @@ class UserDB(BaseStorage):
         async with self._pool.acquire() as conn:
             async with conn.cursor() as cur:
                 try:
+                    # FILE_GROUP and USER_STATS cascade; the tables that may be
+                    # partitioned have no foreign keys and are cleared here
+                    await cur.execute(
+                        """
+                        DELETE gf FROM FILE_GROUP_FILE gf
+                        JOIN FILE_GROUP g ON g.group_id = gf.group_id
+                        WHERE g.user_id = %s
+                        """,
+                        (user_id,)
+                    )
+                    await cur.execute("DELETE FROM FILE_GROUP_FILE WHERE user_id = %s", (user_id,))
+                    await cur.execute("DELETE FROM USER_FILE WHERE user_id = %s", (user_id,))
                     await cur.execute("DELETE FROM TGUSER WHERE user_id = %s", (user_id,))
                     deleted = cur.rowcount > 0
                     await conn.commit()
+                    self._replicas.touch(("user", user_id))
                     return bool(deleted)
                 except Exception:
                     await conn.rollback()
                     raise
 
     async def get_users(self) -> AsyncGenerator[User, None]:
-        async with self._pool.acquire() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cur:
-                await cur.execute(
-                    "SELECT user_id, join_date, ban_date, warns, preferred_lang, curt_op, op_id FROM TGUSER"
-                )
+        last_id = -1
+        while True:
+            async with self._replicas.read().acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute(
+                        """
+                        SELECT user_id, join_date, ban_date, warns, preferred_lang, curt_op, op_id
+                        FROM TGUSER WHERE user_id > %s ORDER BY user_id LIMIT %s
+                        """,
+                        (last_id, LIST_BATCH_SIZE)
+                    )
+                    rows = await cur.fetchall()
 
-                while True:
-                    row = await cur.fetchone()
-                    if not row:
-                        break
+            for row in rows:
+                yield User.from_row(row)
+            if len(rows) < LIST_BATCH_SIZE:
+                return
+            last_id = int(rows[-1]["user_id"])
 
-                    yield User.from_row(row)
+    async def get_banned_users(self) -> set[int]:
+        async with self._replicas.read().acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT user_id FROM TGUSER WHERE ban_date IS NOT NULL")
+                rows = await cur.fetchall()
+                return {int(row[0]) for row in rows}
 
     async def count_users(self) -> int:
-        async with self._pool.acquire() as conn:
+        async with self._replicas.read().acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute("SELECT COUNT(*) FROM TGUSER")
                 (count,) = await cur.fetchone()
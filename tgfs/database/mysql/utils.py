@@ -17,12 +17,15 @@
 import os
 
 import json
-from typing import Optional
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Optional
 
 import aiomysql
 
 from tgfs.database.database import BaseStorage
-from tgfs.utils.types import SupportedType
+from tgfs.database.migration import MigrationSkipped
+from tgfs.utils.types import PageCursor, SupportedType
 
 def encode_value(value: SupportedType) -> tuple[bytes, str]:
     if isinstance(value, bytes):
@@ -61,6 +64,128 @@ def decode_value(data: bytes, vtype: str) -> SupportedType:
 
     raise ValueError(f"Unknown type: {vtype}")
 
+def keyset_clause(time_col: str, id_col: str, after: Optional[PageCursor],
+                  before: Optional[PageCursor]) -> tuple[str, list, str]:
+    """
+    Build the WHERE fragment, its parameters and the sort direction for a
+    newest-first keyset page. Pages before a cursor are read in ascending
+    order and must be reversed by the caller.
+    """
+    cursor = after or before
+    if cursor is None:
+        return "", [], "DESC"
+    op, order = ("<", "DESC") if after else (">", "ASC")
+    clause = (
+        f" AND ({time_col} {op} FROM_UNIXTIME(%s)"
+        f" OR ({time_col} = FROM_UNIXTIME(%s) AND {id_col} {op} %s))"
+    )
+    return clause, [cursor.time, cursor.time, cursor.id], order
+
+def read_sql_file(path: str) -> list[str]:
+    sql = Path(path).read_text(encoding="utf-8")
+    statements = []
+    buffer = []
+
+    for line in sql.splitlines():
+        line = line.strip()
+        if not line or line.startswith("--"):
+            continue
+
+        buffer.append(line)
+        if line.endswith(";"):
+            statements.append(" ".join(buffer))
+            buffer.clear()
+
+    return statements
+
+# Named lock held by whichever instance runs the MySQL migrations
+MIGRATION_LOCK = "tgfs.migration"
+
+@asynccontextmanager
+async def migration_lock(params: dict) -> AsyncIterator[None]:
+    """
+    Hold ``MIGRATION_LOCK`` on a connection of its own, outside the pool, so
+    a long migration does not keep a pooled connection busy. Raises
+    ``MigrationSkipped`` right away if another instance holds it.
+    """
+    conn: aiomysql.Connection = await aiomysql.connect(**params)
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT GET_LOCK(%s, 0)", (MIGRATION_LOCK,))
+            if not (await cur.fetchone())[0]:
+                raise MigrationSkipped("another instance is running the migrations")
+            try:
+                yield
+            finally:
+                await cur.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+    finally:
+        conn.close()
+
+# Listings are read in batches of at most this many rows and the connection
+# goes back to the pool between batches, while the caller consumes them.
+LIST_BATCH_SIZE = 500
+
+async def batched(fetch: Callable[..., Awaitable[list[tuple]]], user_id: int, offset: int,
+                  limit: Optional[int], after: Optional[PageCursor], before: Optional[PageCursor]
+                  ) -> AsyncGenerator[tuple, None]:
+    """
+    Yield the rows of a newest-first listing, calling ``fetch`` once per
+    batch. Rows are ``(id, name, unix_time)``; each batch continues after the
+    last row of the previous one. Pages before a cursor are read at once.
+    """
+    if before is not None:
+        for row in await fetch(user_id, offset, limit, after, before):
+            yield row
+        return
+
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = LIST_BATCH_SIZE if remaining is None else min(LIST_BATCH_SIZE, remaining)
+        rows = await fetch(user_id, offset, size, after, None)
+        for row in rows:
+            yield row
+        if len(rows) < size:
+            return
+        if remaining is not None:
+            remaining -= len(rows)
+        after, offset = PageCursor(int(rows[-1][2]), int(rows[-1][0])), 0
+
+# Counters are only bumped once a user's USER_STATS row exists; the row is
+# created from a full count the first time it is read. INSERT ... SELECT takes
+# shared locks on the counted rows, so concurrent writers wait for it.
+RECOUNT_SQL = """
+    INSERT INTO USER_STATS (user_id, file_count, group_count)
+    SELECT u.user_id,
+      (SELECT COUNT(*) FROM USER_FILE uf WHERE uf.user_id = u.user_id),
+      (SELECT COUNT(*) FROM FILE_GROUP fg WHERE fg.user_id = u.user_id)
+    FROM TGUSER u
+    {where}
+    ON DUPLICATE KEY UPDATE
+      file_count = VALUES(file_count),
+      group_count = VALUES(group_count)
+"""
+
+async def bump_counters(cur: aiomysql.Cursor, user_id: int, files: int = 0, groups: int = 0) -> None:
+    await cur.execute(
+        """
+        UPDATE USER_STATS
+        SET file_count = file_count + %s, group_count = group_count + %s
+        WHERE user_id = %s
+        """,
+        (files, groups, user_id)
+    )
+
+async def read_counters(cur: aiomysql.Cursor, user_id: int) -> tuple[int, int]:
+    """Return ``(files, groups)`` for the user, initialising the counters if needed."""
+    query = "SELECT file_count, group_count FROM USER_STATS WHERE user_id = %s"
+    await cur.execute(query, (user_id,))
+    row = await cur.fetchone()
+    if row is None:
+        await cur.execute(RECOUNT_SQL.format(where="WHERE u.user_id = %s"), (user_id,))
+        await cur.execute(query, (user_id,))
+        row = await cur.fetchone()
+    return (int(row[0]), int(row[1])) if row else (0, 0)
+
 
 class UtilDB(BaseStorage):
     _pool: aiomysql.Pool
@@ -125,3 +250,16 @@ class UtilDB(BaseStorage):
                 except Exception:
                     await conn.rollback()
                     raise
+
+    async def recount(self, user_id: Optional[int] = None) -> None:
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                try:
+                    if user_id is None:
+                        await cur.execute(RECOUNT_SQL.format(where=""))
+                    else:
+                        await cur.execute(RECOUNT_SQL.format(where="WHERE u.user_id = %s"), (user_id,))
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
@@ -0,0 +1,255 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Optional
+
+from tgfs.utils.cache_util import LRUCache
+
+log = logging.getLogger(__name__)
+
+InvalidateHandler = Callable[[str, int], None]
+
+
+class SharedCache(ABC):
+    """
+    Metadata cache shared by every instance using the same database.
+
+    Each cached object belongs to a namespace (``file``, ``loc``, ``user``)
+    and an id whose version counter is bumped by :meth:`invalidate`. Values
+    are stored together with the version they were read at and ignored once
+    the counter has moved on, so a write racing with an invalidation can not
+    resurrect stale data. A value may also depend on further counters, such
+    as ``user_files`` for a user's view of a file. Invalidations are also published so other
+    instances can drop their in-process copies.
+    """
+
+    prefix = "tgfs"
+
+    def __init__(self, ttl: int) -> None:
+        self.ttl = ttl
+        self.origin = uuid.uuid4().hex
+        self._handlers: list[InvalidateHandler] = []
+        self._seen = LRUCache(10000)
+
+    @property
+    def channel(self) -> str:
+        return f"{self.prefix}:invalidate"
+
+    def _key(self, ns: str, key: Any) -> str:
+        return f"{self.prefix}:{ns}:{key}"
+
+    def _version_key(self, ns: str, obj_id: int) -> str:
+        return f"{self.prefix}:ver:{ns}:{obj_id}"
+
+    @abstractmethod
+    async def connect(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _mget(self, *keys: str) -> list[Optional[bytes]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _set(self, key: str, value: bytes, ttl: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _publish(self, message: bytes) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, handler: InvalidateHandler) -> None:
+        self._handlers.append(handler)
+
+    async def get(self, ns: str, obj_id: int, key: Any,
+                  *depends: tuple[str, int]) -> tuple[Optional[dict], Optional[list[int]]]:
+        """
+        Return the cached value (or ``None``) and the current versions of
+        ``obj_id`` and of the ``(ns, id)`` pairs in ``depends``, which must
+        be passed back to :meth:`set`.
+        """
+        try:
+            raw, *versions = await self._mget(
+                self._key(ns, key), self._version_key(ns, obj_id),
+                *(self._version_key(dep_ns, dep_id) for dep_ns, dep_id in depends)
+            )
+        except Exception: # pylint: disable=W0718
+            log.warning("Shared cache read failed", exc_info=True)
+            return None, None
+        version = [int(v or 0) for v in versions]
+        if raw is None:
+            return None, version
+        data = json.loads(raw)
+        if data["v"] != version:
+            return None, version
+        return data["d"], version
+
+    async def set(self, ns: str, key: Any, value: dict, version: Optional[list[int]]) -> None:
+        if version is None:
+            return
+        try:
+            raw = json.dumps({"v": version, "d": value}, separators=(",", ":")).encode()
+            await self._set(self._key(ns, key), raw, self.ttl)
+        except Exception: # pylint: disable=W0718
+            log.warning("Shared cache write failed", exc_info=True)
+
+    async def invalidate(self, ns: str, obj_id: int) -> None:
+        try:
+            version = await self._incr(self._version_key(ns, obj_id))
+            await self._publish(json.dumps({
+                "ns": ns, "id": obj_id, "v": version, "origin": self.origin
+            }, separators=(",", ":")).encode())
+        except Exception: # pylint: disable=W0718
+            log.warning("Shared cache invalidation failed", exc_info=True)
+
+    def _dispatch(self, raw: bytes) -> None:
+        msg = json.loads(raw)
+        if msg["origin"] == self.origin:
+            return
+        key = (msg["ns"], msg["id"])
+        if self._seen.get(key, 0, count=False) >= msg["v"]:
+            return
+        self._seen.set(key, msg["v"])
+        for handler in self._handlers:
+            try:
+                handler(msg["ns"], msg["id"])
+            except Exception: # pylint: disable=W0718
+                log.error("Invalidation handler failed", exc_info=True)
+
+
+class RedisSharedCache(SharedCache):
+    """Shared cache on any server speaking the Redis protocol."""
+
+    def __init__(self, url: str, ttl: int) -> None:
+        super().__init__(ttl)
+        self.url = url
+        self._redis = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        try:
+            from redis import asyncio as aioredis # pylint: disable=C0415
+        except ImportError as e:
+            raise RuntimeError("redis is required for SHARED_CACHE_URL=redis://...") from e
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception: # pylint: disable=W0718
+                log.warning("Shared cache subscription lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def close(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+        if self._pubsub:
+            await self._pubsub.aclose()
+        if self._redis:
+            await self._redis.aclose()
+
+    async def _mget(self, *keys: str) -> list[Optional[bytes]]:
+        return await self._redis.mget(keys)
+
+    async def _set(self, key: str, value: bytes, ttl: int) -> None:
+        await self._redis.set(key, value, ex=ttl)
+
+    async def _incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+    async def _publish(self, message: bytes) -> None:
+        await self._redis.publish(self.channel, message)
+
+
+class _MemoryStore:
+    def __init__(self) -> None:
+        self.values: dict[str, tuple[bytes, Optional[float]]] = {}
+        self.subscribers: list[SharedCache] = []
+
+
+class MemorySharedCache(SharedCache):
+    """
+    In-process stand-in for :class:`RedisSharedCache`.
+
+    Instances created with the same name share one store, which lets tests
+    run several "instances" inside a single process.
+    """
+
+    _stores: dict[str, _MemoryStore] = {}
+
+    def __init__(self, name: str, ttl: int) -> None:
+        super().__init__(ttl)
+        self.store = self._stores.setdefault(name, _MemoryStore())
+
+    async def connect(self) -> None:
+        self.store.subscribers.append(self)
+
+    async def close(self) -> None:
+        if self in self.store.subscribers:
+            self.store.subscribers.remove(self)
+
+    async def _mget(self, *keys: str) -> list[Optional[bytes]]:
+        now = time.monotonic()
+        result = []
+        for key in keys:
+            value, expires = self.store.values.get(key, (None, None))
+            if expires is not None and expires <= now:
+                self.store.values.pop(key, None)
+                value = None
+            result.append(value)
+        return result
+
+    async def _set(self, key: str, value: bytes, ttl: int) -> None:
+        self.store.values[key] = (value, time.monotonic() + ttl)
+
+    async def _incr(self, key: str) -> int:
+        value = int(self.store.values.get(key, (b"0", None))[0]) + 1
+        self.store.values[key] = (str(value).encode(), None)
+        return value
+
+    async def _publish(self, message: bytes) -> None:
+        for subscriber in list(self.store.subscribers):
+            subscriber._dispatch(message) # pylint: disable=W0212
+
+
+def shared_cache_from_url(url: str, ttl: int) -> SharedCache:
+    if url.startswith("memory://"):
+        return MemorySharedCache(url[len("memory://"):], ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedCache(url, ttl)
+    raise RuntimeError(f"Unsupported SHARED_CACHE_URL '{url}'")
@@ -0,0 +1,73 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from pathlib import Path
+
+import aiosqlite
+
+from tgfs.database.cache import CacheDB
+from tgfs.database.write_behind import WriteBehindDB
+
+from .file import FileDB
+from .user import UserDB
+from .group import GroupDB
+from .utils import UtilDB
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+)
+
+class SQLiteDB(CacheDB, WriteBehindDB, FileDB, GroupDB, UserDB, UtilDB):
+    is_connected: bool = False
+
+    async def connect(self, *, path: str, cached_statements: int = 256) -> None:  # pylint: disable=W0221
+        if self.is_connected:
+            return
+        # aiosqlite runs each connection on its own thread. Transactions are
+        # opened explicitly, and sqlite3 keeps up to ``cached_statements``
+        # prepared statements per connection.
+        self._writer = await self._open(path, cached_statements)
+        if path == ":memory:":
+            self._reader = self._writer
+        else:
+            self._reader = await self._open(path, cached_statements)
+            await self._reader.execute("PRAGMA query_only = ON")
+        self._write_lock = asyncio.Lock()
+        self.is_connected = True
+
+    @staticmethod
+    async def _open(path: str, cached_statements: int) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(path, isolation_level=None, cached_statements=cached_statements)
+        conn.row_factory = aiosqlite.Row
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def close(self, force: bool = False) -> None:
+        if self.is_connected or force:
+            if self._reader is not self._writer:
+                await self._reader.close()
+            await self._writer.close()
+            self.is_connected = False
+
+    async def init_db(self) -> None:
+        schema = Path("tgfs/database/sqlite/schema.sql").read_text(encoding="utf-8")
+        async with self._write_lock:
+            await self._writer.executescript(schema)
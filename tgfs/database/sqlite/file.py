@@ -0,0 +1,274 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import AsyncGenerator, Optional
+
+import aiosqlite
+from telethon.tl.types import InputDocumentFileLocation, InputPhotoFileLocation
+
+from tgfs.utils.types import FileSource, FileInfo, InputTypeLocation, PageCursor
+
+from .utils import SQLiteBase, bump_counters, from_ts, keyset_clause
+
+FILE_COLUMNS = "f.id AS file_id, f.dc_id, f.size AS file_size, f.mime_type, f.file_name, f.thumb_size, f.is_deleted"
+
+UPSERT_FILE_SQL = """
+    INSERT INTO TGFILE (id, dc_id, size, mime_type, file_name, thumb_size, is_deleted)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+      dc_id = excluded.dc_id,
+      size = excluded.size,
+      mime_type = excluded.mime_type,
+      file_name = excluded.file_name,
+      thumb_size = excluded.thumb_size,
+      is_deleted = excluded.is_deleted
+"""
+
+UPSERT_USER_FILE_SQL = """
+    INSERT INTO USER_FILE (user_id, id, source_chat_id, source_msg_id)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, id) DO UPDATE SET
+      source_chat_id = COALESCE(excluded.source_chat_id, source_chat_id),
+      source_msg_id = COALESCE(excluded.source_msg_id, source_msg_id)
+"""
+
+UPSERT_LOCATION_SQL = """
+    INSERT INTO FILE_LOCATION (bot_id, id, access_hash, file_reference)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (bot_id, id) DO UPDATE SET
+      access_hash = excluded.access_hash,
+      file_reference = excluded.file_reference
+"""
+
+def row_to_file(row: aiosqlite.Row) -> FileInfo:
+    return FileInfo(
+        id=int(row["file_id"]),
+        dc_id=int(row["dc_id"]),
+        file_size=int(row["file_size"]),
+        mime_type=row["mime_type"],
+        file_name=row["file_name"],
+        thumb_size=row["thumb_size"],
+        is_deleted=bool(row["is_deleted"]),
+    )
+
+def row_to_location(file: FileInfo, row: aiosqlite.Row) -> InputTypeLocation:
+    cls = InputPhotoFileLocation if file.thumb_size else InputDocumentFileLocation
+    return cls(
+        id=file.id,
+        access_hash=int(row["access_hash"]),
+        file_reference=bytes(row["file_reference"]),
+        thumb_size=file.thumb_size
+    )
+
+
+class FileDB(SQLiteBase):
+
+    async def add_file(self, user_id: int, file: FileInfo, source: FileSource) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                UPSERT_FILE_SQL,
+                (
+                    file.id, file.dc_id, file.file_size, file.mime_type,
+                    file.file_name, file.thumb_size,
+                    file.is_deleted
+                )
+            )
+            async with conn.execute(
+                "SELECT 1 FROM USER_FILE WHERE user_id = ? AND id = ?",
+                (user_id, file.id)
+            ) as cur:
+                exists = await cur.fetchone() is not None
+            await conn.execute(
+                UPSERT_USER_FILE_SQL,
+                (user_id, file.id, source.chat_id, source.message_id)
+            )
+            if not exists:
+                await bump_counters(conn, user_id, files=1)
+
+    async def update_file_restriction(self, file_id: int, status: bool) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                "UPDATE TGFILE SET is_deleted = ? WHERE id = ?",
+                (status, file_id)
+            )
+
+    async def get_file(self, file_id: int, user_id: Optional[int] = None) -> Optional[FileInfo]:
+        if user_id is None:
+            query = f"SELECT {FILE_COLUMNS} FROM TGFILE f WHERE f.id = ?"
+            params = (file_id,)
+        else:
+            query = f"""
+                SELECT {FILE_COLUMNS}
+                FROM USER_FILE uf
+                JOIN TGFILE f ON f.id = uf.id
+                WHERE uf.user_id = ? AND uf.id = ?
+            """
+            params = (user_id, file_id)
+
+        async with self._reader.execute(query, params) as cur:
+            row = await cur.fetchone()
+        return row_to_file(row) if row else None
+
+    async def get_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
+        async with self._reader.execute(
+            """
+            SELECT access_hash, file_reference
+            FROM FILE_LOCATION
+            WHERE id = ? AND bot_id = ?
+            """,
+            (file.id, bot_id)
+        ) as cur:
+            row = await cur.fetchone()
+        return row_to_location(file, row) if row else None
+
+    async def resolve_stream(self, file_id: int, user_id: int, bot_id: int
+                             ) -> tuple[Optional[FileInfo], Optional[InputTypeLocation]]:
+        async with self._reader.execute(
+            f"""
+            SELECT {FILE_COLUMNS}, fl.access_hash, fl.file_reference
+            FROM USER_FILE uf
+            JOIN TGFILE f ON f.id = uf.id
+            LEFT JOIN FILE_LOCATION fl
+              ON fl.id = uf.id AND fl.bot_id = ?
+            WHERE uf.user_id = ? AND uf.id = ?
+            """,
+            (bot_id, user_id, file_id)
+        ) as cur:
+            row = await cur.fetchone()
+        if not row:
+            return None, None
+
+        file = row_to_file(row)
+        if row["access_hash"] is None:
+            return file, None
+        return file, row_to_location(file, row)
+
+    async def get_source(self, file_id: int, user_id: int) -> Optional[FileSource]:
+        async with self._reader.execute(
+            """
+            SELECT source_chat_id, source_msg_id, added_at
+            FROM USER_FILE
+            WHERE id = ? AND user_id = ?
+            """,
+            (file_id, user_id)
+        ) as cur:
+            row = await cur.fetchone()
+        if not row:
+            return None
+        return FileSource(
+            chat_id=int(row["source_chat_id"]),
+            message_id=int(row["source_msg_id"]),
+            time=from_ts(row["added_at"])
+        )
+
+    async def upsert_location(self, bot_id: int, loc: InputTypeLocation) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                UPSERT_LOCATION_SQL,
+                (bot_id, loc.id, loc.access_hash, loc.file_reference)
+            )
+
+    async def upsert_locations(self, items: list[tuple[int, InputTypeLocation]]) -> None:
+        async with self._transaction() as conn:
+            await conn.executemany(
+                UPSERT_LOCATION_SQL,
+                [(bot_id, loc.id, loc.access_hash, loc.file_reference) for bot_id, loc in items]
+            )
+
+    async def get_files(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                        after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+                        ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+
+        clause, params, order = keyset_clause("uf.added_at", "uf.id", after, before)
+        base_sql = f"""
+            SELECT f.id, f.file_name, CAST(strftime('%s', uf.added_at) AS INTEGER)
+            FROM USER_FILE uf
+            JOIN TGFILE f ON f.id = uf.id
+            WHERE uf.user_id = ?{clause}
+            ORDER BY uf.added_at {order}, uf.id {order}
+        """
+
+        params = [user_id, *params]
+
+        if limit is not None:
+            base_sql += " LIMIT ?"
+            params.append(limit)
+            if not clause:
+                base_sql += " OFFSET ?"
+                params.append(offset)
+
+        rows = await self._reader.execute_fetchall(base_sql, params)
+
+        if before:
+            rows = rows[::-1]
+        for file_id, file_name, added_at in rows:
+            yield int(file_id), str(file_name), PageCursor(int(added_at), int(file_id))
+
+    async def get_files2(self, user_id: int, file_ids: list[int], full: bool = False,
+                         ) -> AsyncGenerator[FileInfo | tuple[int, str], None]:
+
+        if not file_ids:
+            return
+
+        placeholders = ",".join(["?"] * len(file_ids))
+
+        if full:
+            select_clause = FILE_COLUMNS
+        else:
+            select_clause = "f.id, f.file_name"
+
+        base_sql = f"""
+            SELECT {select_clause}
+            FROM TGFILE f
+            JOIN USER_FILE uf ON f.id = uf.id
+            WHERE uf.user_id = ?
+              AND f.id IN ({placeholders})
+            ORDER BY uf.added_at DESC
+        """
+
+        async with self._reader.execute(base_sql, [user_id, *file_ids]) as cur:
+            async for row in cur:
+                if full:
+                    yield row_to_file(row)
+                else:
+                    yield int(row[0]), str(row[1])
+
+    async def get_file_users(self, file_id: int, ) -> set[int]:
+        rows = await self._reader.execute_fetchall(
+            "SELECT user_id FROM USER_FILE WHERE id = ?",
+            (file_id,)
+        )
+        return {int(row[0]) for row in rows}
+
+    async def total_files(self, user_id: int) -> int:
+        files, _ = await self._read_counters(user_id)
+        return files
+
+    async def delete_file(self, file_id: int) -> bool:
+        async with self._transaction() as conn:
+            async with conn.execute("DELETE FROM TGFILE WHERE id = ?", (file_id,)) as cur:
+                return cur.rowcount > 0
+
+    async def remove_file(self, file_id: int, user_id: int) -> bool:
+        async with self._transaction() as conn:
+            async with conn.execute(
+                "DELETE FROM USER_FILE WHERE id = ? AND user_id = ?",
+                (file_id, user_id)
+            ) as cur:
+                deleted = cur.rowcount > 0
+            if deleted:
+                await bump_counters(conn, user_id, files=-1)
+            return deleted
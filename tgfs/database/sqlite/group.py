@@ -0,0 +1,271 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import AsyncGenerator, Optional
+
+import aiosqlite
+
+from tgfs.utils.types import FileInfo, FileSource, GroupFile, GroupInfo, InputTypeLocation, PageCursor
+
+from .file import UPSERT_FILE_SQL, UPSERT_LOCATION_SQL, UPSERT_USER_FILE_SQL
+from .utils import SQLiteBase, bump_counters, from_ts, keyset_clause
+
+UPSERT_GROUP_FILE_SQL = """
+    INSERT INTO FILE_GROUP_FILE (group_id, user_id, id, order_index)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (group_id, user_id, id) DO UPDATE SET
+      order_index = excluded.order_index
+"""
+
+class GroupDB(SQLiteBase):
+
+    @staticmethod
+    async def _last_order(conn: aiosqlite.Connection, group_id: int) -> int:
+        async with conn.execute(
+            "SELECT COALESCE(MAX(order_index), 0) FROM FILE_GROUP_FILE WHERE group_id = ?",
+            (group_id,)
+        ) as cur:
+            row = await cur.fetchone()
+        return int(row[0]) if row else 0
+
+    async def create_group(self, user_id: int, name: str) -> int:
+        async with self._transaction() as conn:
+            async with conn.execute(
+                "INSERT INTO FILE_GROUP (user_id, name) VALUES (?, ?)",
+                (user_id, name)
+            ) as cur:
+                group_id = cur.lastrowid
+            await bump_counters(conn, user_id, groups=1)
+            return group_id
+
+    async def add_file_to_group(self, group_id: int, user_id: int, file_id: int, order: Optional[int] = None) -> None:
+        async with self._transaction() as conn:
+            if order is None:
+                order = await self._last_order(conn, group_id) + 1
+            await conn.execute(UPSERT_GROUP_FILE_SQL, (group_id, user_id, file_id, order))
+
+    async def add_files_to_group(self, group_id: int, user_id: int, bot_id: int,
+                                 files: list[tuple[FileInfo, FileSource, InputTypeLocation]]) -> None:
+        if not files:
+            return
+        async with self._transaction() as conn:
+            start = await self._last_order(conn, group_id)
+            file_ids = list({file.id for file, _, _ in files})
+            async with conn.execute(
+                f"""
+                SELECT COUNT(*) FROM USER_FILE
+                WHERE user_id = ? AND id IN ({", ".join(["?"] * len(file_ids))})
+                """,
+                (user_id, *file_ids)
+            ) as cur:
+                existing = (await cur.fetchone())[0]
+            await conn.executemany(
+                UPSERT_FILE_SQL,
+                [
+                    (file.id, file.dc_id, file.file_size, file.mime_type,
+                     file.file_name, file.thumb_size, file.is_deleted)
+                    for file, _, _ in files
+                ]
+            )
+            await conn.executemany(
+                UPSERT_USER_FILE_SQL,
+                [
+                    (user_id, file.id, source.chat_id, source.message_id)
+                    for file, source, _ in files
+                ]
+            )
+            await bump_counters(conn, user_id, files=len(file_ids) - int(existing))
+            await conn.executemany(
+                UPSERT_LOCATION_SQL,
+                [
+                    (bot_id, loc.id, loc.access_hash, loc.file_reference)
+                    for _, _, loc in files
+                ]
+            )
+            await conn.executemany(
+                UPSERT_GROUP_FILE_SQL,
+                [
+                    (group_id, user_id, file.id, start + i)
+                    for i, (file, _, _) in enumerate(files, 1)
+                ]
+            )
+
+    async def get_groups(self, user_id: int, offset: int = 0, limit: Optional[int] = None,
+                         after: Optional[PageCursor] = None, before: Optional[PageCursor] = None
+        ) -> AsyncGenerator[tuple[int, str, PageCursor], None]:
+        clause, params, order = keyset_clause("created_at", "group_id", after, before)
+        base_sql = f"""
+                    SELECT group_id, name, CAST(strftime('%s', created_at) AS INTEGER)
+                    FROM FILE_GROUP
+                    WHERE user_id = ?{clause}
+                    ORDER BY created_at {order}, group_id {order}
+                    """
+        params = [user_id, *params]
+
+        if limit is not None:
+            base_sql += " LIMIT ?"
+            params.append(limit)
+            if not clause:
+                base_sql += " OFFSET ?"
+                params.append(offset)
+
+        rows = await self._reader.execute_fetchall(base_sql, params)
+
+        if before:
+            rows = rows[::-1]
+        for group_id, name, created_at in rows:
+            yield int(group_id), str(name), PageCursor(int(created_at), int(group_id))
+
+    async def get_group(self, group_id: int, user_id: int) -> Optional[GroupInfo]:
+        async with self._reader.execute(
+            """
+            SELECT group_id, user_id, name, created_at
+            FROM FILE_GROUP
+            WHERE group_id = ? AND user_id = ?
+            """,
+            (group_id, user_id)
+        ) as cur:
+            row = await cur.fetchone()
+        if not row:
+            return None
+
+        rows = await self._reader.execute_fetchall(
+            "SELECT id FROM FILE_GROUP_FILE WHERE group_id = ? ORDER BY order_index ASC",
+            (group_id,)
+        )
+        return GroupInfo(
+            group_id=int(row["group_id"]),
+            user_id=int(row["user_id"]),
+            name=row["name"],
+            created_at=from_ts(row["created_at"]),
+            files=[int(r["id"]) for r in rows]
+        )
+
+    async def get_group_with_files(self, group_id: int, user_id: int
+                                   ) -> Optional[tuple[GroupInfo, list[GroupFile]]]:
+        rows = await self._reader.execute_fetchall(
+            """
+            SELECT g.group_id, g.user_id, g.name, g.created_at,
+              f.id, f.file_name, f.size, f.mime_type, f.is_deleted, gf.order_index
+            FROM FILE_GROUP g
+            LEFT JOIN FILE_GROUP_FILE gf ON gf.group_id = g.group_id
+            LEFT JOIN TGFILE f ON f.id = gf.id
+            WHERE g.group_id = ? AND g.user_id = ?
+            ORDER BY gf.order_index ASC, gf.id ASC
+            """,
+            (group_id, user_id)
+        )
+        if not rows:
+            return None
+
+        row = rows[0]
+        files = [
+            GroupFile(
+                id=int(r["id"]),
+                file_name=r["file_name"],
+                file_size=int(r["size"]),
+                mime_type=r["mime_type"],
+                order=int(r["order_index"]),
+                is_deleted=bool(r["is_deleted"]),
+            )
+            for r in rows if r["id"] is not None
+        ]
+        return GroupInfo(
+            group_id=int(row["group_id"]),
+            user_id=int(row["user_id"]),
+            name=row["name"],
+            created_at=from_ts(row["created_at"]),
+            files=[f.id for f in files]
+        ), files
+
+    async def iter_group_files(self, group_id: int, user_id: int, batch_size: int = 500
+                               ) -> AsyncGenerator[GroupFile, None]:
+        last_order, last_id = -1, 0
+        while True:
+            rows = await self._reader.execute_fetchall(
+                """
+                SELECT gf.id, f.file_name, f.size, f.mime_type, gf.order_index, f.is_deleted
+                FROM FILE_GROUP_FILE gf
+                JOIN FILE_GROUP g ON g.group_id = gf.group_id
+                JOIN TGFILE f ON f.id = gf.id
+                WHERE gf.group_id = ? AND g.user_id = ?
+                  AND (gf.order_index > ? OR (gf.order_index = ? AND gf.id > ?))
+                ORDER BY gf.order_index ASC, gf.id ASC
+                LIMIT ?
+                """,
+                (group_id, user_id, last_order, last_order, last_id, batch_size)
+            )
+
+            for file_id, file_name, size, mime_type, order, is_deleted in rows:
+                yield GroupFile(int(file_id), file_name, int(size), mime_type, int(order), bool(is_deleted))
+            if len(rows) < batch_size:
+                return
+            last_order, last_id = int(rows[-1][4]), int(rows[-1][0])
+
+    async def get_next_group_file(self, file_id: int, user_id: int) -> Optional[int]:
+        async with self._reader.execute(
+            """
+            SELECT nxt.id
+            FROM FILE_GROUP_FILE cur
+            JOIN FILE_GROUP_FILE nxt
+              ON nxt.group_id = cur.group_id
+              AND (nxt.order_index > cur.order_index
+                OR (nxt.order_index = cur.order_index AND nxt.id > cur.id))
+            WHERE cur.user_id = ? AND cur.id = ?
+            ORDER BY cur.group_id DESC, nxt.order_index ASC, nxt.id ASC
+            LIMIT 1
+            """,
+            (user_id, file_id)
+        ) as cur:
+            row = await cur.fetchone()
+        return int(row[0]) if row else None
+
+    async def delete_group(self, group_id: int, user_id: int) -> None:
+        async with self._transaction() as conn:
+            async with conn.execute(
+                "DELETE FROM FILE_GROUP WHERE group_id = ? AND user_id = ?",
+                (group_id, user_id)
+            ) as cur:
+                deleted = cur.rowcount
+            if deleted:
+                await bump_counters(conn, user_id, groups=-deleted)
+
+    async def update_group_name(self, group_id: int, user_id: int, name: str) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                "UPDATE FILE_GROUP SET name = ? WHERE group_id = ? AND user_id = ?",
+                (name, group_id, user_id)
+            )
+
+    async def update_group_order(self, group_id: int, file_id: int, user_id: int, new_order: int) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                """
+                UPDATE FILE_GROUP_FILE
+                SET order_index = ?
+                WHERE group_id = ?
+                  AND id = ?
+                  AND EXISTS (
+                    SELECT 1 FROM FILE_GROUP fg
+                    WHERE fg.group_id = FILE_GROUP_FILE.group_id AND fg.user_id = ?
+                  )
+                """,
+                (new_order, group_id, file_id, user_id)
+            )
+
+    async def total_groups(self, user_id: int) -> int:
+        _, groups = await self._read_counters(user_id)
+        return groups
@@ -0,0 +1,82 @@
+CREATE TABLE IF NOT EXISTS TGFILE (
+    id INTEGER PRIMARY KEY,
+    dc_id INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mime_type TEXT,
+    file_name TEXT,
+    thumb_size TEXT,
+    is_deleted INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS FILE_LOCATION (
+  bot_id INTEGER NOT NULL,
+  id INTEGER NOT NULL,
+  access_hash INTEGER NULL,
+  file_reference BLOB NULL,
+  PRIMARY KEY (bot_id, id),
+  FOREIGN KEY (id) REFERENCES TGFILE(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_file_location_id ON FILE_LOCATION (id);
+
+CREATE TABLE IF NOT EXISTS TGUSER (
+    user_id INTEGER PRIMARY KEY,
+    join_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ban_date TEXT NULL,
+    warns INTEGER NOT NULL DEFAULT 0,
+    preferred_lang TEXT NOT NULL DEFAULT 'en',
+    curt_op INTEGER DEFAULT 0,
+    op_id INTEGER DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_ban ON TGUSER (user_id) WHERE ban_date IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS USER_FILE (
+  user_id INTEGER NOT NULL,
+  id INTEGER NOT NULL,
+  source_chat_id INTEGER NULL,
+  source_msg_id INTEGER NULL,
+  added_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (user_id, id),
+  FOREIGN KEY (user_id) REFERENCES TGUSER(user_id) ON DELETE CASCADE,
+  FOREIGN KEY (id) REFERENCES TGFILE(id) ON DELETE RESTRICT
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_user_file_added ON USER_FILE (user_id, added_at);
+CREATE INDEX IF NOT EXISTS idx_user_file_id ON USER_FILE (id);
+
+CREATE TABLE IF NOT EXISTS FILE_GROUP (
+  group_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  name TEXT NOT NULL,
+  created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (user_id) REFERENCES TGUSER(user_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_group_created ON FILE_GROUP (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS FILE_GROUP_FILE (
+  group_id INTEGER NOT NULL,
+  user_id INTEGER NOT NULL,
+  id INTEGER NOT NULL,
+  order_index INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (group_id, user_id, id),
+  FOREIGN KEY (group_id) REFERENCES FILE_GROUP(group_id) ON DELETE CASCADE,
+  FOREIGN KEY (user_id, id) REFERENCES USER_FILE(user_id, id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_group_file_order ON FILE_GROUP_FILE (group_id, order_index, id);
+CREATE INDEX IF NOT EXISTS idx_group_file_user_file ON FILE_GROUP_FILE (user_id, id);
+
+CREATE TABLE IF NOT EXISTS USER_STATS (
+  user_id INTEGER PRIMARY KEY,
+  file_count INTEGER NOT NULL DEFAULT 0,
+  group_count INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY (user_id) REFERENCES TGUSER(user_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS APP_CONFIG (
+  k TEXT PRIMARY KEY,
+  v BLOB NOT NULL,
+  type TEXT NOT NULL CHECK (type IN ('bytes', 'bool', 'int', 'str', 'json'))
+);
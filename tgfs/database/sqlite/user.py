@@ -0,0 +1,81 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import AsyncGenerator, Optional
+
+from tgfs.utils.types import User
+
+from .utils import SQLiteBase, to_ts
+
+USER_COLUMNS = "user_id, join_date, ban_date, warns, preferred_lang, curt_op, op_id"
+
+class UserDB(SQLiteBase):
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        async with self._reader.execute(
+            f"SELECT {USER_COLUMNS} FROM TGUSER WHERE user_id = ?",
+            (user_id,)
+        ) as cur:
+            row = await cur.fetchone()
+        if not row:
+            return None
+        return User.from_row(dict(row))
+
+    async def add_user(self, user_id: int) -> bool:
+        async with self._transaction() as conn:
+            async with conn.execute(
+                "INSERT OR IGNORE INTO TGUSER (user_id) VALUES (?)",
+                (user_id,)
+            ) as cur:
+                return cur.rowcount > 0
+
+    async def upsert_user(self, user: User) -> bool:
+        async with self._transaction() as conn:
+            await conn.execute(
+                f"""
+                INSERT INTO TGUSER ({USER_COLUMNS})
+                VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                  join_date = excluded.join_date,
+                  ban_date = excluded.ban_date,
+                  warns = excluded.warns,
+                  preferred_lang = excluded.preferred_lang,
+                  curt_op = excluded.curt_op,
+                  op_id = excluded.op_id
+                """,
+                (user.user_id, to_ts(user.join_date), to_ts(user.ban_date), user.warns,
+                 user.preferred_lang, user.curt_op.value, user.op_id)
+            )
+        return True
+
+    async def delete_user(self, user_id: int) -> bool:
+        async with self._transaction() as conn:
+            async with conn.execute("DELETE FROM TGUSER WHERE user_id = ?", (user_id,)) as cur:
+                return cur.rowcount > 0
+
+    async def get_users(self) -> AsyncGenerator[User, None]:
+        async with self._reader.execute(f"SELECT {USER_COLUMNS} FROM TGUSER") as cur:
+            async for row in cur:
+                yield User.from_row(dict(row))
+
+    async def get_banned_users(self) -> set[int]:
+        rows = await self._reader.execute_fetchall("SELECT user_id FROM TGUSER WHERE ban_date IS NOT NULL")
+        return {int(row[0]) for row in rows}
+
+    async def count_users(self) -> int:
+        async with self._reader.execute("SELECT COUNT(*) FROM TGUSER") as cur:
+            (count,) = await cur.fetchone()
+        return int(count)
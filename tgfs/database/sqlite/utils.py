@@ -0,0 +1,169 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import datetime
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiosqlite
+
+from tgfs.database.database import BaseStorage
+from tgfs.database.mysql.utils import decode_value, encode_value
+from tgfs.utils.types import PageCursor, SupportedType
+
+# Timestamps are stored the way CURRENT_TIMESTAMP writes them: UTC text that
+# sorts in time order.
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def to_ts(value: Optional[datetime.datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.UTC)
+    return value.strftime(TS_FORMAT)
+
+def from_ts(value: Optional[str]) -> Optional[datetime.datetime]:
+    if value is None:
+        return None
+    return datetime.datetime.strptime(value, TS_FORMAT)
+
+def keyset_clause(time_col: str, id_col: str, after: Optional[PageCursor],
+                  before: Optional[PageCursor]) -> tuple[str, list, str]:
+    """SQLite counterpart of :func:`tgfs.database.mysql.utils.keyset_clause`."""
+    cursor = after or before
+    if cursor is None:
+        return "", [], "DESC"
+    op, order = ("<", "DESC") if after else (">", "ASC")
+    clause = (
+        f" AND ({time_col} {op} datetime(?, 'unixepoch')"
+        f" OR ({time_col} = datetime(?, 'unixepoch') AND {id_col} {op} ?))"
+    )
+    return clause, [cursor.time, cursor.time, cursor.id], order
+
+# Same scheme as the MySQL backend: counters are bumped once the USER_STATS
+# row exists and the row is built from a full count the first time it is read.
+# The WHERE clause is required for SQLite to parse the upsert.
+RECOUNT_SQL = """
+    INSERT INTO USER_STATS (user_id, file_count, group_count)
+    SELECT u.user_id,
+      (SELECT COUNT(*) FROM USER_FILE uf WHERE uf.user_id = u.user_id),
+      (SELECT COUNT(*) FROM FILE_GROUP fg WHERE fg.user_id = u.user_id)
+    FROM TGUSER u
+    {where}
+    ON CONFLICT (user_id) DO UPDATE SET
+      file_count = excluded.file_count,
+      group_count = excluded.group_count
+"""
+
+async def bump_counters(conn: aiosqlite.Connection, user_id: int, files: int = 0, groups: int = 0) -> None:
+    await conn.execute(
+        """
+        UPDATE USER_STATS
+        SET file_count = file_count + ?, group_count = group_count + ?
+        WHERE user_id = ?
+        """,
+        (files, groups, user_id)
+    )
+
+
+class SQLiteBase(BaseStorage):
+    """
+    Connections shared by the SQLite mixins.
+
+    All writes go through one connection and are serialized by
+    ``_write_lock``; reads use a second connection, which in WAL mode never
+    waits for the writer.
+    """
+
+    _reader: aiosqlite.Connection
+    _writer: aiosqlite.Connection
+    _write_lock: asyncio.Lock
+
+    @asynccontextmanager
+    async def _transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        async with self._write_lock:
+            await self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    async def _read_counters(self, user_id: int) -> tuple[int, int]:
+        """Return ``(files, groups)`` for the user, initialising the counters if needed."""
+        query = "SELECT file_count, group_count FROM USER_STATS WHERE user_id = ?"
+        async with self._reader.execute(query, (user_id,)) as cur:
+            row = await cur.fetchone()
+        if row is None:
+            async with self._transaction() as conn:
+                await conn.execute(RECOUNT_SQL.format(where="WHERE u.user_id = ?"), (user_id,))
+                async with conn.execute(query, (user_id,)) as cur:
+                    row = await cur.fetchone()
+        return (int(row[0]), int(row[1])) if row else (0, 0)
+
+
+class UtilDB(SQLiteBase):
+
+    async def get_secret(self, rotate=False) -> bytes:
+        if not rotate:
+            async with self._reader.execute(
+                "SELECT v FROM APP_CONFIG WHERE k = ?",
+                ("link.secret",)
+            ) as cur:
+                row = await cur.fetchone()
+            if row:
+                return bytes(row[0])
+
+        secret = os.urandom(32)
+        await self.set_config_value("link.secret", secret)
+        return secret
+
+    async def get_config_value(self, key: str) -> Optional[SupportedType]:
+        async with self._reader.execute(
+            "SELECT v, type FROM APP_CONFIG WHERE k = ?",
+            (key,)
+        ) as cur:
+            row = await cur.fetchone()
+        if not row:
+            return None
+
+        data, vtype = row
+        return decode_value(bytes(data), vtype)
+
+    async def set_config_value(self, key: str, value: SupportedType) -> None:
+        data, vtype = encode_value(value)
+
+        async with self._transaction() as conn:
+            await conn.execute(
+                """
+                INSERT INTO APP_CONFIG (k, v, type)
+                VALUES (?, ?, ?)
+                ON CONFLICT (k) DO UPDATE SET
+                  v = excluded.v,
+                  type = excluded.type
+                """,
+                (key, data, vtype)
+            )
+
+    async def recount(self, user_id: Optional[int] = None) -> None:
+        async with self._transaction() as conn:
+            if user_id is None:
+                await conn.execute(RECOUNT_SQL.format(where="WHERE true"))
+            else:
+                await conn.execute(RECOUNT_SQL.format(where="WHERE u.user_id = ?"), (user_id,))
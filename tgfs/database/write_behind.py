@@ -0,0 +1,121 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from tgfs.config import Config
+from tgfs.database.database import BaseStorage
+from tgfs.utils.types import FileInfo, InputTypeLocation
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindDB(BaseStorage):
+    """
+    Buffers ``upsert_location`` calls when ``WRITE_BEHIND`` is enabled.
+
+    Repeated writes to the same ``(bot_id, file_id)`` are coalesced and the
+    buffer is written with :meth:`upsert_locations` once it holds
+    ``WRITE_BEHIND_BATCH`` entries or ``WRITE_BEHIND_DELAY_MS`` after the
+    first buffered write. Lookups see buffered locations before they reach
+    the database. Must come after :class:`CacheDB` and before the backend
+    mixins in the MRO.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._pending: dict[tuple[int, int], InputTypeLocation] = {}
+        self._flushing: dict[tuple[int, int], InputTypeLocation] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flushed = 0
+        self._failed = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **super().stats(),
+            "write_behind": {
+                "pending": len(self._pending) + len(self._flushing),
+                "flushed": self._flushed,
+                "failed": self._failed,
+            }
+        }
+
+    def _buffered(self, file_id: int, bot_id: int) -> Optional[InputTypeLocation]:
+        key = (bot_id, file_id)
+        loc = self._pending.get(key)
+        return loc if loc is not None else self._flushing.get(key)
+
+    def _on_timer(self) -> None:
+        self._flush_timer = None
+        self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            batch = [(bot_id, loc) for (bot_id, _), loc in self._flushing.items()]
+            try:
+                await super().upsert_locations(batch)
+                self._flushed += len(batch)
+            except Exception: # pylint: disable=W0718
+                log.warning("Batched write of %d locations failed, writing them one by one", len(batch), exc_info=True)
+                for bot_id, loc in batch:
+                    try:
+                        await super().upsert_location(bot_id, loc)
+                        self._flushed += 1
+                    except Exception: # pylint: disable=W0718
+                        self._failed += 1
+                        log.error("Dropping location of file %d for bot %d", loc.id, bot_id, exc_info=True)
+            finally:
+                self._flushing = {}
+
+    async def get_location(self, file: FileInfo, bot_id: int) -> Optional[InputTypeLocation]:
+        loc = self._buffered(file.id, bot_id)
+        if loc is not None:
+            return loc
+        return await super().get_location(file, bot_id)
+
+    async def resolve_stream(self, file_id: int, user_id: int, bot_id: int
+                             ) -> tuple[Optional[FileInfo], Optional[InputTypeLocation]]:
+        file, loc = await super().resolve_stream(file_id, user_id, bot_id)
+        if file is not None:
+            loc = self._buffered(file_id, bot_id) or loc
+        return file, loc
+
+    async def upsert_location(self, bot_id: int, loc: InputTypeLocation) -> None:
+        if not Config.WRITE_BEHIND:
+            await super().upsert_location(bot_id, loc)
+            return
+        self._pending[(bot_id, loc.id)] = loc
+        if len(self._pending) >= Config.WRITE_BEHIND_BATCH:
+            await self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                Config.WRITE_BEHIND_DELAY_MS / 1000, self._on_timer
+            )
+
+    async def delete_file(self, file_id: int) -> bool:
+        # A buffered location would otherwise outlive (or fail against) the file
+        await self.flush()
+        return await super().delete_file(file_id)
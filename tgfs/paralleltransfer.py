@@ -39,10 +39,18 @@ from telethon.tl.types import DcOption
 from telethon.errors import DcIdInvalidError
 
 from tgfs.config import Config
+from tgfs.utils.cache_util import LRUCache
 from tgfs.utils.types import InputTypeLocation
 
 root_log = logging.getLogger(__name__)
 
+# Parts fetched ahead of a request, keyed by chunk_key(). Filled by
+# ParallelTransferrer.warm() and consumed by downloads of the same parts.
+chunk_cache = LRUCache(None, ttl=Config.PREFETCH_TTL, maxweight=Config.PREFETCH_CACHE_SIZE, weigh=len)
+
+def chunk_key(location: InputTypeLocation, offset: int) -> tuple[int, str, int]:
+    return location.id, location.thumb_size, offset
+
 if Config.CONNECTION_LIMIT > 25:
     root_log.warning("The connection limit should not be set above 25 to avoid"
                      " infinite disconnect/reconnect loops")
@@ -191,20 +199,22 @@ class ParallelTransferrer:
             async with dcm.get_connection() as conn:
                 log = conn.log
                 while part <= last_part:
-                    result = await self.client._call(conn.sender, request)
+                    data = chunk_cache.get(chunk_key(request.location, request.offset))
+                    if data is None:
+                        data = (await self.client._call(conn.sender, request)).bytes
 
-                    if not result.bytes:
+                    if not data:
                         break
 
                     request.offset += part_size
                     if last_part == first_part:
-                        yield result.bytes[first_part_cut:last_part_cut]
+                        yield data[first_part_cut:last_part_cut]
                     elif part == first_part:
-                        yield result.bytes[first_part_cut:]
+                        yield data[first_part_cut:]
                     elif part == last_part:
-                        yield result.bytes[:last_part_cut]
+                        yield data[:last_part_cut]
                     else:
-                        yield result.bytes
+                        yield data
                     log.debug("Part %d/%d (total %d) downloaded", part, last_part, part_count)
                     part += 1
                 log.info("Parallel download finished")
@@ -222,7 +232,7 @@ class ParallelTransferrer:
         first_part_cut = offset % part_size
         first_part = math.floor(offset / part_size)
         last_part_cut = (limit % part_size) + 1
-        last_part = math.ceil(limit / part_size)
+        last_part = limit // part_size
         part_count = math.ceil(file_size / part_size)
         self.log.info("Starting parallel download: chunks %d-%d of %d %s",
                        first_part, last_part, part_count, location)
@@ -232,3 +242,21 @@ class ParallelTransferrer:
             request, first_part, last_part, part_count, part_size, dc_id,
             first_part_cut, last_part_cut
         )
+
+    async def warm(self, location: InputTypeLocation, dc_id: int, file_size: int, parts: int) -> int:
+        """Fetch the first ``parts`` parts of a file into ``chunk_cache``."""
+        part_size = Config.DOWNLOAD_PART_SIZE
+        parts = min(parts, math.ceil(file_size / part_size))
+        request = GetFileRequest(location, offset=0, limit=part_size)
+        fetched = 0
+        async with self._get_dc_manager(dc_id).get_connection() as conn:
+            for _ in range(parts):
+                key = chunk_key(location, request.offset)
+                if key not in chunk_cache:
+                    result = await self.client._call(conn.sender, request)
+                    if not result.bytes:
+                        break
+                    chunk_cache.set(key, result.bytes)
+                    fetched += 1
+                request.offset += part_size
+        return fetched
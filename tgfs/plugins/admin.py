@@ -60,6 +60,7 @@ Admin Commands:
 /deletefile <userid> <fileid>: delete a file associated with a user
 /deletefile <token>: delete a file using its token
 /parsetoken <token>: parse a token to retrieve the file ID and user ID
+/recount [userid]: rebuild the file and group counters of a user, or of every user
 
 download url strcture: "http://<PUBLIC_URL>/dl/<token>/<signature>"
 """)
@@ -225,3 +226,20 @@ async def handle_parsetoken_command(evt: events.NewMessage.Event) -> None:
         return await evt.reply("Invalid Token")
     user_id, file_id = data
     await evt.reply(f"Token {token} is associated with User ID {user_id} and File ID {file_id}")
+
+
+@client.on(events.NewMessage(
+    incoming=True,
+    pattern=r"^/recount(?: (\d+))?$",
+    func=lambda x: x.is_private and not x.file and is_admin(x.sender_id)
+))
+async def handle_recount_command(evt: events.NewMessage.Event) -> None:
+    user_id = evt.pattern_match.group(1)
+    if not user_id:
+        await DB.db.recount()
+        return await evt.reply("Recounted files and groups for all users")
+    user_id = int(user_id)
+    await DB.db.recount(user_id)
+    files = await DB.db.total_files(user_id)
+    groups = await DB.db.total_groups(user_id)
+    await evt.reply(f"User [{user_id}](tg://user?id={user_id}) has {files} files and {groups} groups")
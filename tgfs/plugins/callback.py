@@ -23,6 +23,7 @@ from tgfs.config import Config
 from tgfs.telegram import client
 from tgfs.database import DB
 from tgfs.utils.translation import get_lang
+from tgfs.utils.types import PageCursor
 from tgfs.utils.utils import check_get_user, human_bytes, make_token
 
 log = logging.getLogger(__name__)
@@ -43,12 +44,14 @@ async def handle_tos_button(evt: events.CallbackQuery.Event):
     await evt.edit(buttons=[[Button.inline(lang.AGREED, b"tos_agreed")]])
 
 
-@client.on(events.CallbackQuery(pattern=r"^(fileinfo|groupinfo)_page_(\d+)$"))
+@client.on(events.CallbackQuery(pattern=r"^(fileinfo|groupinfo)_page_(\d+)(?:_([ab])(\d+_\d+))?$"))
 async def handle_list_page(evt: events.CallbackQuery.Event) -> None:
     user = await check_get_user(evt.sender_id, evt.message_id)
     lang = get_lang(user)
     kind = evt.pattern_match.group(1).decode()
     page_no = int(evt.pattern_match.group(2))
+    direction = evt.pattern_match.group(3)
+    cursor = PageCursor.decode(evt.pattern_match.group(4).decode()) if direction else None
     is_group = kind == "groupinfo"
     user_id = evt.sender_id
 
@@ -65,16 +68,22 @@ async def handle_list_page(evt: events.CallbackQuery.Event) -> None:
         await evt.answer(lang.INVALID_PAGE, alert=True)
         return
 
-    offset = page_no * limit
+    # Buttons carry the boundary of the current page so the next one is a
+    # keyset seek; plain page numbers (e.g. from "Back") fall back to OFFSET.
+    kwargs = {"after": cursor} if direction == b"a" else {"before": cursor} if direction else {}
+    offset = 0 if cursor else page_no * limit
     items_gen = (
-        DB.db.get_groups(user_id, offset, limit)
+        DB.db.get_groups(user_id, offset, limit, **kwargs)
         if is_group
-        else DB.db.get_files(user_id, offset, limit)
+        else DB.db.get_files(user_id, offset, limit, **kwargs)
     )
 
     buttons: list[list[Button]] = []
+    first = last = None
 
-    async for item_id, name in items_gen:
+    async for item_id, name, item_cursor in items_gen:
+        first = first or item_cursor
+        last = item_cursor
         buttons.append([
             Button.inline(name, data=f"{kind}_file_{item_id}_{page_no}")
         ])
@@ -85,7 +94,7 @@ async def handle_list_page(evt: events.CallbackQuery.Event) -> None:
 
     nav = []
     if page_no > 0:
-        nav.append(Button.inline("<<", f"{kind}_page_{page_no - 1}"))
+        nav.append(Button.inline("<<", f"{kind}_page_{page_no - 1}_b{first.encode()}"))
 
     nav.append(Button.inline(
         lang.FILES_BUTTON_CURRENT.format(
@@ -94,7 +103,7 @@ async def handle_list_page(evt: events.CallbackQuery.Event) -> None:
     ))
 
     if page_no + 1 < total_pages:
-        nav.append(Button.inline(">>", f"{kind}_page_{page_no + 1}"))
+        nav.append(Button.inline(">>", f"{kind}_page_{page_no + 1}_a{last.encode()}"))
 
     buttons.append(nav)
     buttons.append([Button.inline(lang.BACK_TEXT, b"files_menu")])
@@ -159,18 +168,19 @@ async def handle_groupinfo_button(evt: events.CallbackQuery.Event):
     group_id = int(evt.pattern_match.group(1))
     page_no = int(evt.pattern_match.group(2))
     user_id = evt.sender_id
-    file_info = await DB.db.get_group(group_id, user_id)
-    if file_info is None:
+    result = await DB.db.get_group_with_files(group_id, user_id)
+    if result is None:
         await evt.answer(lang.GROUP_NOT_FOUND_TEXT, alert=True)
         return
+    file_info, files = result
     token = make_token(user_id, file_info.group_id)
     buttons: list[list[Button]] = [
         [Button.url(lang.EXTERNAL_LINK, f"{Config.PUBLIC_URL}/group/{token}")]
     ]
-    if file_info.files and len(file_info.files) <= 98:
-        async for file_id, name in DB.db.get_files2(user_id, file_info.files):
+    if files and len(files) <= 98:
+        for file in files:
             buttons.append(
-                [Button.inline(name, f"fileinfo_file_{file_id}_{page_no}_{group_id}")])
+                [Button.inline(file.file_name, f"fileinfo_file_{file.id}_{page_no}_{group_id}")])
     buttons.append(
         [
             Button.inline(lang.BACK_TEXT, f"groupinfo_page_{page_no}"),
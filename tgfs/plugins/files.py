@@ -110,7 +110,6 @@ async def handle_done_command(evt: events.NewMessage.Event, user=None) -> None:
     elif user.curt_op == Status.GROUP:
         min_id = user.op_id+1
         max_id = msg.id
-        order = 0
         group_id = await DB.db.create_group(user.user_id, str(msg.id))
         try:
             file_msgs: list[Message] = await client.get_messages(
@@ -125,6 +124,7 @@ async def handle_done_command(evt: events.NewMessage.Event, user=None) -> None:
                 user.op_id = 0
                 await DB.db.upsert_user(user)
                 return
+            files: list[tuple[FileInfo, FileSource, InputTypeLocation]] = []
             for file_msg in file_msgs:
                 dc_id, location = cast(
                     tuple[int, InputTypeLocation], get_input_location(file_msg.media))
@@ -141,19 +141,14 @@ async def handle_done_command(evt: events.NewMessage.Event, user=None) -> None:
                     chat_id=file_msg.chat_id,
                     message_id=file_msg.id
                 )
-                await DB.db.add_file(user.user_id, file_info, file_source)
-                await DB.db.upsert_location(
-                    multi_clients[0].client_id,
-                    location
-                )
-                order += 1
-                await DB.db.add_file_to_group(group_id, user.user_id, file_info.id, order)
+                files.append((file_info, file_source, location))
+            await DB.db.add_files_to_group(group_id, user.user_id, multi_clients[0].client_id, files)
             await evt.reply(lang.GROUP_NAME_TEXT)
             user.curt_op = Status.GROUP_NAME
             user.op_id = group_id
             await DB.db.upsert_user(user)
         except Exception as e: # pylint: disable=W0718
-            DB.db.delete_group(group_id, user.user_id)
+            await DB.db.delete_group(group_id, user.user_id)
             log.error(e, exc_info=True, stack_info=True)
     else:
         await evt.reply(lang.UNKNOWN_COMMAND)
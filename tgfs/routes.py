@@ -14,11 +14,18 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
+from typing import AsyncGenerator
+
 from aiohttp import web
 
 from tgfs.config import Config
 from tgfs.paralleltransfer import ParallelTransferrer
+from tgfs.utils.file_cache import file_cache
+from tgfs.utils.prefetch import warm_next
+from tgfs.utils.types import GroupFile
+from tgfs.utils.zipstream import ZipStream
 from tgfs.utils.utils import make_token, parse_token, update_location, uptime_human
 from tgfs.telegram import multi_clients
 from tgfs.database import DB
@@ -30,7 +37,9 @@ routes = web.RouteTableDef()
 async def handle_root(_: web.Request):
     return web.json_response({
         'uptime': uptime_human(),
-        'load': {transfer.client_id: transfer.users for transfer in multi_clients}
+        'load': {transfer.client_id: transfer.users for transfer in multi_clients},
+        'db': DB.db.stats(),
+        'migrations': DB.migrations.stats() if DB.migrations else None,
     })
 
 # @routes.get(r"/{msg_id:-?\d+}/{name}")
@@ -48,7 +57,13 @@ async def handle_file_request(req: web.Request, head: bool = None, watch: bool =
         return web.Response(status=404, text="File not found")
     user_id, file_id = pt
 
-    file = await DB.db.get_file(file_id, user_id)
+    if head:
+        file = await DB.db.get_file(file_id, user_id)
+        location = None
+    else:
+        transfer: ParallelTransferrer = min(multi_clients, key=lambda c: c.users)
+        log.debug("Using client %s", transfer.client_id)
+        file, location = await DB.db.resolve_stream(file_id, user_id, transfer.client_id)
     if not file:
         return web.Response(status=404, text="File not found")
     if file.is_deleted:
@@ -60,18 +75,27 @@ async def handle_file_request(req: web.Request, head: bool = None, watch: bool =
 
     if (until_bytes >= size) or (from_bytes < 0) or (until_bytes < from_bytes):
         return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+
+    disposition = "inline" if watch else "attachment"
+    content_disposition = f'{disposition}; filename="{" ".join(file.file_name.split())}"'
+
     if head:
         body=None
     else:
-        transfer: ParallelTransferrer = min(multi_clients, key=lambda c: c.users)
-        log.debug("Using client %s", transfer.client_id)
-        location = await DB.db.get_location(file, transfer.client_id)
+        warm_next(user_id, file.id)
+        cached = file_cache.get(file)
+        if cached is not None:
+            # FileResponse handles Range/If-Range itself and uses sendfile()
+            return web.FileResponse(cached, headers={
+                "Content-Type": file.mime_type,
+                "Content-Disposition": content_disposition,
+            })
         if location is None:
             source = await DB.db.get_source(file.id, user_id)
             location = await update_location(source, transfer)
         body=transfer.download(location, file.dc_id, size, from_bytes, until_bytes)
-
-    disposition = "inline" if watch else "attachment"
+        if from_bytes == 0 and until_bytes == size - 1 and file_cache.wants(file):
+            body = file_cache.tee(file, body)
 
     return web.Response(
         status=200 if (from_bytes == 0 and until_bytes == size - 1) else 206,
@@ -80,24 +104,120 @@ async def handle_file_request(req: web.Request, head: bool = None, watch: bool =
             "Content-Type": file.mime_type,
             "Content-Range": f"bytes {from_bytes}-{until_bytes}/{size}",
             "Content-Length": str(until_bytes - from_bytes + 1),
-            "Content-Disposition": f'{disposition}; filename="{" ".join(file.file_name.split())}"',
+            "Content-Disposition": content_disposition,
             "Accept-Ranges": "bytes",
         }
     )
 
+GROUP_FORMATS = {
+    "txt": "text/plain; charset=utf-8",
+    "m3u8": "application/vnd.apple.mpegurl",
+    "json": "application/json",
+    "zip": "application/zip",
+}
+GROUP_WRITE_BATCH = 200
+
+def group_entry(fmt: str, user_id: int, file: GroupFile, first: bool) -> str:
+    token = make_token(user_id, file.id)
+    if fmt == "m3u8":
+        name = " ".join((file.file_name or str(file.id)).split())
+        return f"#EXTINF:-1,{name}\n{Config.PUBLIC_URL}/wt/{token}\n"
+    if fmt == "json":
+        return ("" if first else ",") + json.dumps({
+            "id": file.id,
+            "name": file.file_name,
+            "size": file.file_size,
+            "mime_type": file.mime_type,
+            "url": f"{Config.PUBLIC_URL}/dl/{token}",
+        }, separators=(",", ":"))
+    return f"{Config.PUBLIC_URL}/dl/{token}\n"
+
 @routes.get("/group/{payload}/{sig}")
-async def handle_group_request(req: web.Request) -> web.Response:
+@routes.get("/group/{payload}/{sig}/{fmt}")
+async def handle_group_request(req: web.Request) -> web.StreamResponse:
     payload = req.match_info["payload"]
     sig = req.match_info["sig"]
+    fmt = req.match_info.get("fmt", "txt")
+    if fmt not in GROUP_FORMATS:
+        return web.Response(status=404, text="Unknown format")
     pt = parse_token(payload, sig)
     if not pt:
         return web.Response(status=404, text="File not found")
     user_id, group_id = pt
-    group = await DB.db.get_group(group_id, user_id)
-    if group is None:
+    if fmt == "zip":
+        return await handle_group_zip(req, user_id, group_id)
+
+    files = DB.db.iter_group_files(group_id, user_id)
+    first = await anext(files, None)
+    # Only an empty result needs the extra lookup to tell "empty" from "missing"
+    if first is None and await DB.db.get_group(group_id, user_id) is None:
         return web.Response(status=404, text="Group not found")
-    resp = "".join(f"{Config.PUBLIC_URL}/dl/{make_token(user_id, file_id)}\n" for file_id in group.files)
-    return web.Response(status=200, text=resp)
+
+    resp = web.StreamResponse(headers={
+        "Content-Type": GROUP_FORMATS[fmt],
+        "Content-Disposition": f'inline; filename="{group_id}.{fmt}"',
+    })
+    await resp.prepare(req)
+
+    head = {"m3u8": "#EXTM3U\n", "json": f'{{"id":{group_id},"files":['}.get(fmt, "")
+    buffer = [head]
+    if first is not None:
+        buffer.append(group_entry(fmt, user_id, first, True))
+        async for file in files:
+            buffer.append(group_entry(fmt, user_id, file, False))
+            if len(buffer) >= GROUP_WRITE_BATCH:
+                await resp.write("".join(buffer).encode())
+                buffer.clear()
+    if fmt == "json":
+        buffer.append("]}")
+    await resp.write("".join(buffer).encode())
+    await resp.write_eof()
+    return resp
+
+async def handle_group_zip(req: web.Request, user_id: int, group_id: int) -> web.Response:
+    result = await DB.db.get_group_with_files(group_id, user_id)
+    if result is None:
+        return web.Response(status=404, text="Group not found")
+    group, files = result
+
+    async def fetch(file: GroupFile, start: int, end: int) -> AsyncGenerator[bytes, None]:
+        transfer: ParallelTransferrer = min(multi_clients, key=lambda c: c.users)
+        info, location = await DB.db.resolve_stream(file.id, user_id, transfer.client_id)
+        if info is None or info.is_deleted:
+            raise RuntimeError(f"File {file.id} is no longer available")
+        if location is None:
+            source = await DB.db.get_source(info.id, user_id)
+            location = await update_location(source, transfer)
+        async for chunk in transfer.download(location, info.dc_id, info.file_size, start, end):
+            yield chunk
+
+    archive = ZipStream([f for f in files if not f.is_deleted], fetch)
+    size = archive.size
+    headers = {
+        "Content-Type": GROUP_FORMATS["zip"],
+        "Content-Disposition": f'attachment; filename="{" ".join(group.name.split())}.zip"',
+        "Accept-Ranges": "bytes" if archive.seekable() else "none",
+    }
+
+    # Resuming needs the CRC of every member, which is only known once each
+    # of them has been streamed in full; until then the whole archive is sent.
+    if archive.seekable():
+        from_bytes = req.http_range.start or 0
+        until_bytes = (req.http_range.stop or size) - 1
+        if (until_bytes >= size) or (from_bytes < 0) or (until_bytes < from_bytes):
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+    else:
+        from_bytes, until_bytes = 0, size - 1
+
+    headers["Content-Length"] = str(until_bytes - from_bytes + 1)
+    if from_bytes or until_bytes != size - 1:
+        headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{size}"
+
+    return web.Response(
+        status=206 if "Content-Range" in headers else 200,
+        body=archive.stream(from_bytes, until_bytes),
+        headers=headers,
+    )
 
 @routes.get("/dl/{object_id}", allow_head=True)
 async def stream_handler(request: web.Request):
@@ -16,61 +16,266 @@
 
 import asyncio
 import logging
+import time
 
 from collections import OrderedDict
-from typing import Optional, Callable, Awaitable, Any
+from dataclasses import asdict, dataclass
+from typing import Optional, Callable, Awaitable, Any, Hashable, Iterable
 
 log = logging.getLogger(__name__)
 
+_MISSING = object()
+_KWARGS = object()
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+class _Entry:
+    __slots__ = ("value", "expires", "weight")
+
+    def __init__(self, value: Any, expires: Optional[float], weight: int) -> None:
+        self.value = value
+        self.expires = expires
+        self.weight = weight
+
+class LRUCache:
+    """
+    Least recently used mapping with per-entry TTL and optional weight limit.
+
+    ``maxsize`` bounds the number of entries and ``maxweight`` the sum of the
+    entry weights (e.g. bytes), whichever is reached first. ``tags`` maps a
+    key to the tags it is indexed under, so :meth:`invalidate_tag` only
+    touches the matching entries.
+    """
+
+    def __init__(self, maxsize: Optional[int] = 128, ttl: Optional[float] = None,
+                 maxweight: Optional[int] = None, weigh: Optional[Callable[[Any], int]] = None,
+                 tags: Optional[Callable[[Hashable], Iterable[Hashable]]] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.tags = tags
+        self.weight = 0
+        self.stats = CacheStats()
+        self._data: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._tagged: dict[Hashable, set[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            if count:
+                self.stats.misses += 1
+            return default
+        if entry.expires is not None and entry.expires <= time.monotonic():
+            self._remove(key)
+            self.stats.expirations += 1
+            if count:
+                self.stats.misses += 1
+            return default
+        self._data.move_to_end(key)
+        if count:
+            self.stats.hits += 1
+        return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: Any = _MISSING, weight: Optional[int] = None) -> None:
+        if ttl is _MISSING:
+            ttl = self.ttl
+        if weight is None:
+            weight = self.weigh(value) if self.weigh else 1
+        if self.maxweight is not None and weight > self.maxweight:
+            self._remove(key)
+            return
+
+        self._remove(key)
+        expires = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = _Entry(value, expires, weight)
+        self.weight += weight
+        if self.tags is not None:
+            for tag in self.tags(key):
+                self._tagged.setdefault(tag, set()).add(key)
+
+        while self._data and (
+            (self.maxsize is not None and len(self._data) > self.maxsize)
+            or (self.maxweight is not None and self.weight > self.maxweight)
+        ):
+            self._remove(next(iter(self._data)))
+            self.stats.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._remove(key)
+        return default if entry is None else entry.value
+
+    def invalidate_if(self, predicate: Callable[[Hashable], bool]) -> None:
+        for key in [k for k in self._data if predicate(k)]:
+            self._remove(key)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        for key in list(self._tagged.get(tag, ())):
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._tagged.clear()
+        self.weight = 0
+
+    def _remove(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry.weight
+            if self.tags is not None:
+                for tag in self.tags(key):
+                    keys = self._tagged.get(tag)
+                    if keys is not None:
+                        keys.discard(key)
+                        if not keys:
+                            del self._tagged[tag]
+        return entry
+
 class AsyncLRUCache:
-    def __init__(self, fn: Callable[..., Awaitable[Any]], maxsize: Optional[int], use_first_arg: bool) -> None:
+    """
+    Memoizes a coroutine function in an :class:`LRUCache`.
+
+    Concurrent calls with the same key share one in-flight task. Exceptions
+    are never cached; ``None`` results are cached for ``negative_ttl``
+    seconds, or not at all when it is ``None``.
+    """
+
+    def __init__(self, fn: Callable[..., Awaitable[Any]], maxsize: Optional[int], use_first_arg: bool,
+                 ttl: Optional[float] = None, key: Optional[Callable[..., Hashable]] = None,
+                 negative_ttl: Optional[float] = None, maxweight: Optional[int] = None,
+                 weigh: Optional[Callable[[Any], int]] = None,
+                 tags: Optional[Callable[[Hashable], Iterable[Hashable]]] = None) -> None:
         self.fn = fn
-        self.maxsize = maxsize
         self.use_first_arg = use_first_arg
-        self.cache: OrderedDict[int, asyncio.Task] = OrderedDict()
+        self.key = key
+        self.negative_ttl = negative_ttl
+        self.cache = LRUCache(maxsize, ttl, maxweight, weigh, tags)
+        self.pending: dict[Hashable, asyncio.Task] = {}
+        self._loading: dict[Hashable, object] = {}
 
-    def _make_key(self, args, kwargs) -> int:
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def _make_key(self, args, kwargs) -> Hashable:
+        if self.key is not None:
+            return self.key(*args, **kwargs)
         if self.use_first_arg:
             if not args:
                 raise ValueError("First argument missing for use_first_arg=True")
-            return hash(args[0])
-        else:
-            key_data = args
-            if kwargs:
-                key_data += tuple(sorted(kwargs.items()))
-            return hash(key_data)
+            return args[0]
+        if kwargs:
+            return args + (_KWARGS,) + tuple(sorted(kwargs.items()))
+        return args
 
     async def __call__(self, *args, **kwargs) -> Any:
         key = self._make_key(args, kwargs)
 
-        if key in self.cache:
-            task = self.cache[key]
-            self.cache.move_to_end(key)
-            return await asyncio.shield(task)
+        result = self.cache.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._call(key, args, kwargs))
+            self.pending[key] = task
+        return await asyncio.shield(task)
 
-        async def call() -> Any:
-            try:
-                return await self.fn(*args, **kwargs)
-            except Exception:
-                self.cache.pop(key, None)
-                raise
+    async def _call(self, key: Hashable, args, kwargs) -> Any:
+        task = asyncio.current_task()
+        try:
+            result = await self.fn(*args, **kwargs)
+        finally:
+            stored = self.pending.get(key) is task
+            if stored:
+                del self.pending[key]
+        # Skip storing if the key was invalidated while the call was running
+        if stored:
+            if result is not None:
+                self.cache.set(key, result)
+            elif self.negative_ttl is not None:
+                self.cache.set(key, None, ttl=self.negative_ttl)
+        return result
 
-        task = asyncio.create_task(call())
-        self.cache[key] = task
+    def peek(self, *args, **kwargs) -> tuple[bool, Any]:
+        """Return ``(found, value)`` without calling the function."""
+        result = self.cache.get(self._make_key(args, kwargs), _MISSING, count=False)
+        if result is _MISSING:
+            return False, None
+        return True, result
 
-        if self.maxsize is not None and len(self.cache) > self.maxsize:
-            self.cache.popitem(last=False)
+    def begin_key(self, key: Hashable) -> object:
+        """
+        Start loading the value for ``key`` outside of the cached function
+        and return a token for :meth:`end_key`.
+        """
+        token = self._loading[key] = object()
+        return token
 
-        result = await asyncio.shield(task)
-        if result is None:
-            self.cache.pop(key, None)
-        return result
+    def end_key(self, key: Hashable, token: object) -> bool:
+        """
+        Finish a load started with :meth:`begin_key`. Returns False if the
+        key was invalidated since, in which case the result must not be primed.
+        """
+        if self._loading.get(key) is not token:
+            return False
+        del self._loading[key]
+        return True
+
+    def prime(self, value: Any, *args, **kwargs) -> None:
+        """Store ``value`` as the result for the given arguments."""
+        key = self._make_key(args, kwargs)
+        self.pending.pop(key, None)
+        if value is not None:
+            self.cache.set(key, value)
+        elif self.negative_ttl is not None:
+            self.cache.set(key, None, ttl=self.negative_ttl)
+
+    def invalidate(self, *args, **kwargs) -> None:
+        self.invalidate_key(self._make_key(args, kwargs))
+
+    def invalidate_key(self, key: Hashable) -> None:
+        self.pending.pop(key, None)
+        self._loading.pop(key, None)
+        self.cache.pop(key)
+
+    def invalidate_if(self, predicate: Callable[[Hashable], bool]) -> None:
+        for key in [k for k in self.pending if predicate(k)]:
+            del self.pending[key]
+        for key in [k for k in self._loading if predicate(k)]:
+            del self._loading[key]
+        self.cache.invalidate_if(predicate)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        # Only in-flight loads are pending, scanning them is cheap
+        for key in [k for k in self.pending if tag in self.cache.tags(k)]:
+            del self.pending[key]
+        for key in [k for k in self._loading if tag in self.cache.tags(k)]:
+            del self._loading[key]
+        self.cache.invalidate_tag(tag)
 
     def cache_clear(self) -> None:
+        self.pending.clear()
+        self._loading.clear()
         self.cache.clear()
 
-def lru_cache(maxsize: Optional[int] = 128, use_first_arg: bool = False
+def lru_cache(maxsize: Optional[int] = 128, use_first_arg: bool = False, ttl: Optional[float] = None,
+              negative_ttl: Optional[float] = None
     ) -> Callable[[Callable[..., Awaitable[Any]]], AsyncLRUCache]:
     def decorator(fn: Callable[..., Awaitable[Any]]) -> AsyncLRUCache:
-        return AsyncLRUCache(fn, maxsize, use_first_arg)
+        return AsyncLRUCache(fn, maxsize, use_first_arg, ttl, negative_ttl=negative_ttl)
     return decorator
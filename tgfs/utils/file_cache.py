@@ -0,0 +1,135 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import AsyncGenerator, Optional
+
+from tgfs.config import Config
+from tgfs.utils.types import FileInfo
+
+log = logging.getLogger(__name__)
+
+
+class FileCache:
+    """
+    Disk cache of fully downloaded files.
+
+    Files are written while they are streamed to a client and only become
+    visible once every byte has been received, so a cached path can be handed
+    to ``web.FileResponse`` which serves it (including Range requests) with
+    ``sendfile``.
+    """
+
+    def __init__(self, root: Path, max_size: int, max_file_size: int, enabled: bool = True) -> None:
+        self.root = root
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.enabled = enabled
+        self.used = 0
+        self._writing: set[int] = set()
+        # Last access per cached file name, for eviction. Kept in memory so
+        # hits leave the mtime alone: FileResponse derives ETag and
+        # Last-Modified from it, and If-Range must keep matching.
+        self._last_used: dict[str, float] = {}
+
+        if self.enabled:
+            self.root.mkdir(parents=True, exist_ok=True)
+            for path in self.root.iterdir():
+                if path.suffix == ".tmp":
+                    path.unlink(missing_ok=True)
+                elif path.is_file():
+                    st = path.stat()
+                    self.used += st.st_size
+                    self._last_used[path.name] = st.st_mtime
+
+    def path(self, file_id: int) -> Path:
+        return self.root / str(file_id)
+
+    def get(self, file: FileInfo) -> Optional[Path]:
+        if not self.enabled:
+            return None
+        path = self.path(file.id)
+        try:
+            if path.stat().st_size != file.file_size:
+                return None
+        except FileNotFoundError:
+            return None
+        self._last_used[path.name] = time.time()
+        return path
+
+    def wants(self, file: FileInfo) -> bool:
+        return (
+            self.enabled
+            and 0 < file.file_size <= self.max_file_size
+            and file.id not in self._writing
+            and not self.path(file.id).exists()
+        )
+
+    async def tee(self, file: FileInfo, body: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+        """Yield ``body`` unchanged while writing it to the cache."""
+        self._writing.add(file.id)
+        path = self.path(file.id)
+        tmp = path.with_suffix(".tmp")
+        written = 0
+        fp = open(tmp, "wb")  # pylint: disable=R1732
+        try:
+            async for chunk in body:
+                await asyncio.to_thread(fp.write, chunk)
+                written += len(chunk)
+                yield chunk
+            fp.close()
+            if written == file.file_size:
+                os.replace(tmp, path)
+                self._last_used[path.name] = time.time()
+                self.used += written
+                log.debug("Cached file %d (%d bytes)", file.id, written)
+                if self.used > self.max_size:
+                    await asyncio.to_thread(self._evict)
+        finally:
+            fp.close()
+            tmp.unlink(missing_ok=True)
+            self._writing.discard(file.id)
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.root.iterdir():
+            if path.suffix == ".tmp" or not path.is_file():
+                continue
+            st = path.stat()
+            entries.append((self._last_used.get(path.name, st.st_mtime), st.st_size, path))
+        entries.sort()
+
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if used <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            self._last_used.pop(path.name, None)
+            used -= size
+            log.debug("Evicted cached file %s", path.name)
+        self.used = used
+
+
+file_cache = FileCache(
+    Config.FILE_CACHE_DIR,
+    Config.FILE_CACHE_SIZE,
+    Config.FILE_CACHE_MAX_FILE,
+    Config.FILE_CACHE
+)
@@ -0,0 +1,68 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+
+from tgfs.config import Config
+from tgfs.database import DB
+from tgfs.paralleltransfer import ParallelTransferrer
+from tgfs.telegram import multi_clients
+from tgfs.utils.cache_util import LRUCache
+from tgfs.utils.file_cache import file_cache
+from tgfs.utils.utils import update_location
+
+log = logging.getLogger(__name__)
+
+# (user_id, file_id) of streams that already triggered a warm-up, so seeking
+# inside a video doesn't schedule it again
+_recent = LRUCache(10000, ttl=Config.PREFETCH_TTL)
+_tasks: set[asyncio.Task] = set()
+
+
+def warm_next(user_id: int, file_id: int) -> None:
+    """
+    Schedule a warm-up of the file that follows ``file_id`` in the user's
+    group: its metadata and location are loaded into the metadata cache and
+    its first parts into ``chunk_cache``.
+    """
+    if not Config.PREFETCH_NEXT or (user_id, file_id) in _recent:
+        return
+    _recent.set((user_id, file_id), True)
+    task = asyncio.create_task(_warm(user_id, file_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _warm(user_id: int, file_id: int) -> None:
+    try:
+        await asyncio.sleep(Config.PREFETCH_DELAY)
+        next_id = await DB.db.get_next_group_file(file_id, user_id)
+        if next_id is None:
+            return
+
+        transfer: ParallelTransferrer = min(multi_clients, key=lambda c: c.users)
+        file, location = await DB.db.resolve_stream(next_id, user_id, transfer.client_id)
+        if file is None or file.is_deleted or file_cache.get(file) is not None:
+            return
+        if location is None:
+            source = await DB.db.get_source(file.id, user_id)
+            location = await update_location(source, transfer)
+
+        fetched = await transfer.warm(location, file.dc_id, file.file_size, Config.PREFETCH_PARTS)
+        log.debug("Warmed %d parts of file %d after file %d", fetched, next_id, file_id)
+    except Exception: # pylint: disable=W0718
+        log.warning("Warm-up after file %d failed", file_id, exc_info=True)
@@ -99,3 +99,31 @@ class GroupInfo:
     name: str
     created_at: Optional[datetime.datetime]
     files: Optional[list[int]] = None
+
+@dataclass
+class GroupFile:
+    id: int
+    file_name: Optional[str]
+    file_size: int
+    mime_type: Optional[str]
+    order: int
+    is_deleted: bool = False
+
+@dataclass(frozen=True)
+class PageCursor:
+    """
+    Keyset position in a newest-first listing.
+
+    ``time`` is the backend's sort timestamp as an integer (its unit is up
+    to the backend) and ``id`` breaks ties between equal timestamps.
+    """
+    time: int
+    id: int
+
+    def encode(self) -> str:
+        return f"{self.time}_{self.id}"
+
+    @classmethod
+    def decode(cls, data: str) -> "PageCursor":
+        time, id_ = data.split("_", maxsplit=1)
+        return cls(int(time), int(id_))
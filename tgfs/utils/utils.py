@@ -31,6 +31,7 @@ from telethon.tl.custom import Message
 
 from tgfs.config import Config
 from tgfs.paralleltransfer import ParallelTransferrer
+from tgfs.utils.cache_util import LRUCache
 from tgfs.utils.types import FileSource, InputTypeLocation, User
 from tgfs.telegram import client
 from tgfs.database import DB
@@ -39,6 +40,9 @@ log = logging.getLogger(__name__)
 
 START_TIME = time.monotonic()
 
+# Tokens whose signature failed to verify, so retries skip decoding and HMAC
+rejected_tokens = LRUCache(Config.REJECTED_TOKEN_CACHE_SIZE, ttl=Config.NEGATIVE_CACHE_TTL)
+
 async def update_location(source: FileSource, transfer: ParallelTransferrer) -> InputTypeLocation:
     message = cast(Message,await client.forward_messages(
         Config.BIN_CHANNEL, source.message_id, source.chat_id, drop_author=True))
@@ -51,6 +55,9 @@ async def update_location(source: FileSource, transfer: ParallelTransferrer) ->
 async def check_get_user(user_id: int, msg_id, required: bool = True) -> Optional[User]:
     if Config.ALLOWED_IDS and user_id not in Config.ALLOWED_IDS:
         return None
+    if DB.db.known_banned(user_id):
+        await client.send_message(user_id, "You are banned from using this bot.")
+        return None
     user = await DB.db.get_user(user_id)
     if required and user is None:
         await client.send_message(
@@ -86,6 +93,8 @@ def make_token(user_id: int, file_id: int) -> str:
     return token
 
 def parse_token(p_b64: str, s_b64: Optional[str] = None) -> tuple[int, int] | None:
+    if s_b64 is not None and (p_b64, s_b64) in rejected_tokens:
+        return None
     try:
         payload = base64_decode(p_b64)
         sig = base64_decode(s_b64)
@@ -93,11 +102,14 @@ def parse_token(p_b64: str, s_b64: Optional[str] = None) -> tuple[int, int] | No
         if s_b64 is not None:
             expected = hmac.new(Config.SECRET, payload, hashlib.sha256).digest()
             if not hmac.compare_digest(sig, expected):
+                rejected_tokens.set((p_b64, s_b64), True)
                 return None
 
         user_id, file_id = struct.unpack(">QQ", payload)
         return user_id, file_id
     except Exception: # pylint: disable=W0718
+        if s_b64 is not None:
+            rejected_tokens.set((p_b64, s_b64), True)
         return None
 
 def human_time(seconds: int):
@@ -0,0 +1,227 @@
+# tgfilestream
+# Copyright (C) 2025-2026 Deekshith SH
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterator, Callable, Optional, Union
+
+from tgfs.config import Config
+from tgfs.utils.cache_util import LRUCache
+from tgfs.utils.types import GroupFile
+
+# CRC-32 of members that were streamed completely, by file id. A later
+# request can only be served from an offset once every CRC is known.
+crc_cache = LRUCache(Config.ZIP_CRC_CACHE_SIZE)
+
+Fetch = Callable[[GroupFile, int, int], AsyncGenerator[bytes, None]]
+
+_LOCAL = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL = struct.Struct("<IHHHHHHIIIHHHHHII")
+_DESCRIPTOR = struct.Struct("<IIQQ")
+_EXTRA_LOCAL = struct.Struct("<HHQQ")
+_EXTRA_CENTRAL = struct.Struct("<HHQQQ")
+_EOCD64 = struct.Struct("<IQHHIIQQQQ")
+_LOCATOR64 = struct.Struct("<IIQI")
+_EOCD = struct.Struct("<IHHHHIIH")
+
+_VERSION = 45  # ZIP64
+_FLAGS = 0x0808  # data descriptor, UTF-8 names
+_DOS_DATE = (1 << 5) | 1  # 1980-01-01, keeps the output identical between requests
+_U32 = 0xFFFFFFFF
+_U16 = 0xFFFF
+
+
+@dataclass
+class ZipMember:
+    file: GroupFile
+    name: bytes
+    offset: int = 0
+
+    @property
+    def header_size(self) -> int:
+        return _LOCAL.size + len(self.name) + _EXTRA_LOCAL.size
+
+    @property
+    def size(self) -> int:
+        return self.header_size + self.file.file_size + _DESCRIPTOR.size
+
+    def local_header(self) -> bytes:
+        return _LOCAL.pack(
+            0x04034B50, _VERSION, _FLAGS, 0, 0, _DOS_DATE, 0, _U32, _U32, len(self.name),
+            _EXTRA_LOCAL.size
+        ) + self.name + _EXTRA_LOCAL.pack(0x0001, 16, self.file.file_size, self.file.file_size)
+
+    def descriptor(self, crc: int) -> bytes:
+        return _DESCRIPTOR.pack(0x08074B50, crc, self.file.file_size, self.file.file_size)
+
+    def central_header(self, crc: int) -> bytes:
+        return _CENTRAL.pack(
+            0x02014B50, _VERSION, _VERSION, _FLAGS, 0, 0, _DOS_DATE, crc, _U32, _U32,
+            len(self.name), _EXTRA_CENTRAL.size, 0, 0, 0, 0, _U32
+        ) + self.name + _EXTRA_CENTRAL.pack(
+            0x0001, 24, self.file.file_size, self.file.file_size, self.offset
+        )
+
+
+class _Prefetch:
+    """Runs ``source`` ahead of the consumer, holding at most ``depth`` chunks."""
+
+    def __init__(self, source: AsyncIterator[bytes], depth: int) -> None:
+        self.queue: asyncio.Queue[Union[bytes, BaseException, None]] = asyncio.Queue(depth)
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[bytes]) -> None:
+        try:
+            async for chunk in source:
+                await self.queue.put(chunk)
+        except Exception as e: # pylint: disable=W0718
+            await self.queue.put(e)
+            return
+        await self.queue.put(None)
+
+    async def __aiter__(self) -> AsyncGenerator[bytes, None]:
+        while (item := await self.queue.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def cancel(self) -> None:
+        self.task.cancel()
+
+
+class ZipStream:
+    """
+    Store-only ZIP64 archive of a group, produced on the fly.
+
+    Member sizes are known up front, so the archive length is too. CRCs are
+    written to data descriptors after each member; the layout does not
+    depend on them, so every request for the same group yields the same
+    bytes and a byte range can be served once all CRCs are cached.
+    """
+
+    def __init__(self, files: list[GroupFile], fetch: Fetch,
+                 lookahead: int = Config.ZIP_PREFETCH_CHUNKS) -> None:
+        self.fetch = fetch
+        self.lookahead = lookahead
+        self.crcs: dict[int, int] = {}
+        self.members: list[ZipMember] = []
+        seen: set[bytes] = set()
+        offset = 0
+        for file in files:
+            member = ZipMember(file, self._unique_name(file, seen), offset)
+            offset += member.size
+            self.members.append(member)
+        self.central_offset = offset
+        self.central_size = sum(
+            _CENTRAL.size + len(m.name) + _EXTRA_CENTRAL.size for m in self.members
+        )
+        self.size = self.central_offset + self.central_size + \
+            _EOCD64.size + _LOCATOR64.size + _EOCD.size
+
+    @staticmethod
+    def _unique_name(file: GroupFile, seen: set[bytes]) -> bytes:
+        name = (file.file_name or str(file.id)).replace("/", "_").replace("\\", "_")
+        candidate, n = name, 1
+        while candidate.encode() in seen:
+            stem, dot, ext = name.rpartition(".")
+            candidate = f"{stem} ({n}).{ext}" if dot and stem else f"{name} ({n})"
+            n += 1
+        seen.add(candidate.encode())
+        return candidate.encode()
+
+    def seekable(self) -> bool:
+        return all(self._crc(m) is not None for m in self.members)
+
+    def _crc(self, member: ZipMember) -> Optional[int]:
+        if member.file.file_size == 0:
+            return 0
+        return self.crcs.get(member.file.id, crc_cache.get(member.file.id))
+
+    def _trailer(self) -> bytes:
+        count = len(self.members)
+        central = b"".join(m.central_header(self._crc(m)) for m in self.members)
+        eocd64_offset = self.central_offset + self.central_size
+        return central + _EOCD64.pack(
+            0x06064B50, _EOCD64.size - 12, _VERSION, _VERSION, 0, 0, count, count,
+            self.central_size, self.central_offset
+        ) + _LOCATOR64.pack(0x07064B50, 0, eocd64_offset, 1) + _EOCD.pack(
+            0x06054B50, 0, 0, min(count, _U16), min(count, _U16), _U32, _U32, 0
+        )
+
+    def _source(self, index: int, start: int, end: int) -> tuple[AsyncIterator[bytes], int, int]:
+        """Start fetching the part of a member's data inside ``start``-``end``."""
+        member = self.members[index]
+        pos = member.offset + member.header_size
+        lo, hi = max(start - pos, 0), min(end - pos, member.file.file_size - 1)
+        if lo > hi:
+            return _empty(), lo, hi
+        return _Prefetch(self.fetch(member.file, lo, hi), self.lookahead), lo, hi
+
+    async def stream(self, start: int = 0, end: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+        """
+        Yield bytes ``start`` to ``end`` (inclusive) of the archive. Only a
+        :meth:`seekable` archive can be read from anywhere but the start.
+        """
+        end = self.size - 1 if end is None else end
+        sources: dict[int, tuple[AsyncIterator[bytes], int, int]] = {}
+        try:
+            for i, member in enumerate(self.members):
+                if member.offset + member.size <= start:
+                    continue
+                if member.offset > end:
+                    break
+
+                pos = member.offset
+                if pos + member.header_size > start:
+                    yield member.local_header()[max(start - pos, 0):end - pos + 1]
+                pos += member.header_size
+
+                size = member.file.file_size
+                if i not in sources:
+                    sources[i] = self._source(i, start, end)
+                source, lo, hi = sources[i]
+                crc, received = 0, 0
+                async for chunk in source:
+                    # Fetch the start of the next member while this one is sent
+                    if i + 1 < len(self.members) and i + 1 not in sources:
+                        sources[i + 1] = self._source(i + 1, start, end)
+                    crc = zlib.crc32(chunk, crc)
+                    received += len(chunk)
+                    yield chunk
+                del sources[i]
+                if received != max(hi - lo + 1, 0):
+                    raise RuntimeError(f"File {member.file.id} ended after {received} bytes")
+                if size and lo == 0 and hi == size - 1:
+                    self.crcs[member.file.id] = crc
+                    crc_cache.set(member.file.id, crc)
+                pos += size
+
+                if pos + _DESCRIPTOR.size > start and pos <= end:
+                    yield member.descriptor(self._crc(member))[max(start - pos, 0):end - pos + 1]
+
+            if end >= self.central_offset:
+                yield self._trailer()[max(start - self.central_offset, 0):end - self.central_offset + 1]
+        finally:
+            for source, _, _ in sources.values():
+                if isinstance(source, _Prefetch):
+                    source.cancel()
+
+
+async def _empty() -> AsyncGenerator[bytes, None]:
+    return
+    yield  # pylint: disable=W0101